@@ -0,0 +1,77 @@
+"""
+Caller-side latency of logging an event when stdout is slow: print() vs. the queue-backed log_event().
+
+Runs each mode in a child process whose stdout is a pipe drained by this process at one line every
+--line-delay-ms, as a slow log collector would. The child times every call and reports percentiles,
+plus the records log_event() dropped once LOG_QUEUE_SIZE was exceeded.
+
+Usage (from passkey_server/, extension_server/ or idp_server/):
+    python ../benchmarks/logging_latency.py --events 5000 --line-delay-ms 0.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+EVENT = {"username": "user1@example.com", "cred_props": {"rk": True}, "duration_ms": 12.34}
+
+
+def child(mode: str, events: int):
+    sys.path.insert(0, os.getcwd())
+    try:
+        from utils.log import dropped_log_records, log_event
+    except ImportError:  # idp_server keeps it at the top level
+        from log import dropped_log_records, log_event
+
+    latencies = []
+    for _ in range(events):
+        started = time.perf_counter()
+        if mode == "print":
+            print(json.dumps({"event": "registration_success", **EVENT}))
+        else:
+            log_event("registration_success", **EVENT)
+        latencies.append(time.perf_counter() - started)
+
+    latencies.sort()
+    print(json.dumps({
+        "mode": mode,
+        "mean_us": round(statistics.mean(latencies) * 1e6, 1),
+        "p50_us": round(latencies[len(latencies) // 2] * 1e6, 1),
+        "p99_us": round(latencies[int(len(latencies) * 0.99) - 1] * 1e6, 1),
+        "max_us": round(latencies[-1] * 1e6, 1),
+        "dropped": dropped_log_records() if mode == "log_event" else 0,
+    }), file=sys.stderr, flush=True)
+
+
+def run(mode: str, events: int, line_delay: float) -> dict:
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--child", mode, "--events", str(events)],
+        env={**os.environ, "LOG_SUCCESS_SAMPLE_RATE": "1"}, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    for _ in process.stdout:
+        time.sleep(line_delay)
+    stderr = process.communicate()[1].decode()
+    if process.returncode:
+        raise SystemExit(stderr)
+    return json.loads(stderr.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--line-delay-ms", type=float, default=0.5, help="time the consumer spends per line")
+    parser.add_argument("--child", choices=("print", "log_event"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.events)
+        return
+    for mode in ("print", "log_event"):
+        print(run(mode, args.events, args.line_delay_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Before/after benchmark for serializing WebAuthn options responses.
+
+before: dict(options) (fido2's Mapping conversion) rendered by Starlette's JSONResponse (json.dumps)
+after:  options_to_json(options.public_key) rendered by OrjsonResponse (orjson.dumps)
+
+Both paths start from the same fido2 options object and must produce the same JSON. For each number of
+registered credentials (excludeCredentials / allowCredentials entries) it reports CPU time per response
+and rendered bytes per second of CPU time.
+
+Usage (from passkey_server/):
+    python ../benchmarks/responses.py --credentials 0 10 50 --responses 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from fastapi.responses import JSONResponse
+from fido2.server import Fido2Server
+from fido2.webauthn import (
+    PublicKeyCredentialDescriptor, PublicKeyCredentialRpEntity, PublicKeyCredentialType,
+    PublicKeyCredentialUserEntity,
+)
+
+sys.path.insert(0, os.getcwd())
+
+from utils.options import options_to_json  # noqa: E402
+from utils.responses import OrjsonResponse  # noqa: E402
+
+CHALLENGE_TOKEN = "x" * 400  # about the size of an encoded challenge token
+
+
+def before(options) -> bytes:
+    return JSONResponse(content={"publicKey": dict(options)["publicKey"], "challenge_token": CHALLENGE_TOKEN}).body
+
+
+def after(options) -> bytes:
+    return OrjsonResponse(content={"publicKey": options_to_json(options.public_key),
+                                   "challenge_token": CHALLENGE_TOKEN}).body
+
+
+def build_options(ceremony: str, credentials: int):
+    server = Fido2Server(PublicKeyCredentialRpEntity(id="localhost", name="Benchmark RP"))
+    descriptors = [PublicKeyCredentialDescriptor(type=PublicKeyCredentialType.PUBLIC_KEY, id=os.urandom(32))
+                   for _ in range(credentials)]
+    if ceremony == "register":
+        user = PublicKeyCredentialUserEntity(id=os.urandom(32), name="user1@example.com",
+                                             display_name="user1@example.com")
+        options, _ = server.register_begin(user=user, credentials=descriptors, resident_key_requirement="preferred",
+                                           user_verification="discouraged", authenticator_attachment="cross-platform")
+    else:
+        options, _ = server.authenticate_begin(descriptors)
+    return options
+
+
+def measure(render, options, responses: int) -> dict:
+    size = 0
+    cpu_started = time.process_time()
+    for _ in range(responses):
+        size += len(render(options))
+    cpu = time.process_time() - cpu_started
+    return {
+        "cpu_us_per_response": round(cpu / responses * 1e6, 1),
+        "bytes_per_cpu_second": round(size / cpu),
+        "body_bytes": size // responses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--credentials", type=int, nargs="+", default=[0, 10, 50])
+    parser.add_argument("--responses", type=int, default=20000)
+    args = parser.parse_args()
+
+    for ceremony in ("register", "authenticate"):
+        for credentials in args.credentials:
+            options = build_options(ceremony, credentials)
+            if json.loads(before(options)) != json.loads(after(options)):
+                raise SystemExit(f"{ceremony}: before and after render different JSON")
+            results = {name: measure(render, options, args.responses)
+                       for name, render in (("before", before), ("after", after))}
+            speedup = results["before"]["cpu_us_per_response"] / results["after"]["cpu_us_per_response"]
+            for name, result in results.items():
+                print({"ceremony": ceremony, "credentials": credentials, "path": name, **result})
+            print({"ceremony": ceremony, "credentials": credentials, "cpu_speedup": round(speedup, 2)})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Concurrent-client benchmark for extension token validation against the real extension server.
+
+For each --workers count, starts extension_server under uvicorn and drives POST /extensions/prepare
+(HS256 token check + challenge store) with each --clients count of concurrent keep-alive clients,
+reporting throughput and latency percentiles. Load is generated from --load-processes processes so a
+single client process does not cap the numbers; give the server and the load generator separate cores.
+
+--offload additionally times the token check alone, inline on the event loop vs. a thread pool vs. a
+process pool, at the same client counts: the comparison behind keeping the check inline.
+
+Usage (from extension_server/):
+    python ../benchmarks/token_validation.py --clients 1 10 50 200 --workers 1 2 4 --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import httpx
+import jwt
+
+sys.path.insert(0, os.getcwd())
+
+from config import Config  # noqa: E402
+from validations.validate import validate_runtime_token  # noqa: E402
+
+USERNAME = "user1@example.com"
+
+# Admission limits are per IP, and every benchmark client shares one
+SERVER_ENV = {
+    "RATE_LIMIT_IP_PER_SECOND": "1000000",
+    "RATE_LIMIT_IP_BURST": "1000000",
+    "RATE_LIMIT_USER_PER_SECOND": "1000000",
+    "RATE_LIMIT_USER_BURST": "1000000",
+    "MAX_IN_FLIGHT_REQUESTS": "100000",
+    "LOG_SUCCESS_SAMPLE_RATE": "0",
+}
+
+
+def make_token() -> str:
+    issued_at = int(datetime.now(timezone.utc).timestamp())
+    return jwt.encode({
+        Config.USER_KEY: USERNAME,
+        Config.ACCOUNT_ID_KEY: "acc001",
+        "iss": Config.JWT_ORIGINAL_ISSUER,
+        "aud": Config.JWT_AUDIENCE,
+        "iat": issued_at,
+        "exp": issued_at + 600,
+    }, Config.JWT_SECRET, algorithm=Config.JWT_ALGORITHM)
+
+
+# ---- HTTP: the real app ----
+def start_server(workers: int) -> tuple[subprocess.Popen, str]:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "extension_server:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning", "--no-access-log"],
+        env={**os.environ, **SERVER_ENV, "PYTHONPATH": "."}, stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            httpx.get(f"{url}/docs")
+            return process, url
+        except httpx.TransportError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise SystemExit("extension server did not start")
+            time.sleep(0.1)
+
+
+def generate_load(url: str, token: str, clients: int, requests: int) -> list[float]:
+    """Runs in a load process: `clients` concurrent keep-alive clients share `requests` requests."""
+
+    async def run():
+        latencies = []
+        remaining = requests
+        headers = {"Authorization": f"Bearer {token}"}
+        async with httpx.AsyncClient(base_url=url, headers=headers,
+                                     limits=httpx.Limits(max_connections=clients)) as client:
+            async def worker():
+                nonlocal remaining
+                while remaining > 0:
+                    remaining -= 1
+                    started = time.perf_counter()
+                    response = await client.post("/extensions/prepare", json={"username": USERNAME})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+
+            await asyncio.gather(*(worker() for _ in range(clients)))
+        return latencies
+
+    return asyncio.run(run())
+
+
+def measure_http(url: str, token: str, clients: int, requests: int, load: ProcessPoolExecutor,
+                 load_processes: int) -> dict:
+    processes = min(load_processes, clients)
+    started = time.perf_counter()
+    futures = [load.submit(generate_load, url, token, max(1, clients // processes), requests // processes)
+               for _ in range(processes)]
+    latencies = sorted(latency for future in futures for latency in future.result())
+    elapsed = time.perf_counter() - started
+    return {
+        "clients": clients,
+        "throughput_rps": round(len(latencies) / elapsed),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+# ---- Token check alone: inline vs. offloaded ----
+async def measure_offload(mode: str, token: str, clients: int, requests: int, executor=None) -> dict:
+    loop = asyncio.get_running_loop()
+    remaining = requests
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            if executor is None:
+                validate_runtime_token(token, USERNAME)
+            else:
+                await loop.run_in_executor(executor, validate_runtime_token, token, USERNAME)
+            await asyncio.sleep(0)  # yield like a real request would between reads/writes
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "clients": clients,
+        "per_op_us": round(elapsed / requests * 1e6, 1),
+        "throughput_rps": round(requests / elapsed),
+    }
+
+
+async def compare_offload(token: str, client_counts: list[int], requests: int, pool_size: int):
+    with ThreadPoolExecutor(pool_size) as threads, ProcessPoolExecutor(pool_size) as processes:
+        await measure_offload("warmup", token, pool_size, pool_size * 10, processes)
+        for clients in client_counts:
+            for mode, executor in (("inline", None), ("thread_pool", threads), ("process_pool", processes)):
+                print(await measure_offload(mode, token, clients, requests, executor))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="uvicorn worker counts")
+    parser.add_argument("--requests", type=int, default=20000, help="requests per measurement")
+    parser.add_argument("--load-processes", type=int, default=4)
+    parser.add_argument("--offload", action="store_true", help="also compare inline/thread/process token checks")
+    parser.add_argument("--pool-size", type=int, default=8, help="thread/process pool size for --offload")
+    args = parser.parse_args()
+
+    token = make_token()
+    validate_runtime_token(token, USERNAME)  # fail fast on a misconfigured secret
+
+    with ProcessPoolExecutor(args.load_processes) as load:
+        for workers in args.workers:
+            process, url = start_server(workers)
+            try:
+                measure_http(url, token, args.load_processes, args.load_processes * 50, load,
+                             args.load_processes)  # warm up connections and workers
+                for clients in args.clients:
+                    print({"workers": workers, **measure_http(url, token, clients, args.requests, load,
+                                                              args.load_processes)}, flush=True)
+            finally:
+                process.terminate()
+                process.wait()
+
+    if args.offload:
+        asyncio.run(compare_offload(token, args.clients, args.requests, args.pool_size))
+
+
+if __name__ == "__main__":
+    main()
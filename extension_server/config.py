@@ -14,6 +14,43 @@ class Config:
     JWT_LEEWAY_SECONDS = 30
 
     CHALLENGE_TTL_SECONDS = 120
+    CHALLENGE_SWEEP_INTERVAL_SECONDS = int(os.getenv("CHALLENGE_SWEEP_INTERVAL", "60"))
+
+    # Request payload limits (decoded bytes)
+    MAX_CLIENT_DATA_BYTES = int(os.getenv("MAX_CLIENT_DATA_BYTES", "4096"))
+
+    # Admission control (per-IP / per-username token buckets, load shedding)
+    RATE_LIMIT_IP_PER_SECOND = float(os.getenv("RATE_LIMIT_IP_PER_SECOND", "10"))
+    RATE_LIMIT_IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", "20"))
+    RATE_LIMIT_USER_PER_SECOND = float(os.getenv("RATE_LIMIT_USER_PER_SECOND", "1"))
+    RATE_LIMIT_USER_BURST = int(os.getenv("RATE_LIMIT_USER_BURST", "5"))
+    RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "10000"))
+    MAX_IN_FLIGHT_REQUESTS = int(os.getenv("MAX_IN_FLIGHT_REQUESTS", "64"))
+    MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "128"))
+    MAX_QUEUE_WAIT_SECONDS = float(os.getenv("MAX_QUEUE_WAIT_SECONDS", "0.5"))
+    # Largest body read to rate-limit by username (413 above); leaves room for the encoded clientDataJSON
+    MAX_USERNAME_BODY_BYTES = int(os.getenv("MAX_USERNAME_BODY_BYTES",
+                                            str((MAX_CLIENT_DATA_BYTES * 4 + 2) // 3 + 1024)))
+
+    # Event loop monitoring
+    LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+    LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", "100"))
+
+    # Sampling profiler (GET /debug/profile, X-Profile-Token header); disabled unless an admin token is set.
+    # The admin token also guards GET /metrics/memory.
+    PROFILER_ADMIN_TOKEN = os.getenv("PROFILER_ADMIN_TOKEN")
+    PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+    PROFILER_MAX_SECONDS = int(os.getenv("PROFILER_MAX_SECONDS", "60"))
+    PROFILER_MAX_DEPTH = int(os.getenv("PROFILER_MAX_DEPTH", "64"))
+
+    # Memory instrumentation (GET /metrics/memory, requires X-Admin-Token)
+    TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "0"))  # Traceback depth; 0 disables allocation tracing
+    MEMORY_TOP_ALLOCATIONS = int(os.getenv("MEMORY_TOP_ALLOCATIONS", "10"))
+
+    # Logging
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_SUCCESS_SAMPLE_RATE = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", "1.0"))  # Fraction of success events kept
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 
     # CORS (optional)
     ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
@@ -1,7 +1,8 @@
 from fastapi import Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 
-from exceptions.errors import ExtensionValidationError
+from exceptions.errors import ExtensionValidationError, InvalidCredentialFormatError
 
 
 async def base_exception_handler(request: Request, exc: ExtensionValidationError):
@@ -11,5 +12,19 @@ async def base_exception_handler(request: Request, exc: ExtensionValidationError
     )
 
 
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    # Only location and message: never echo (possibly oversized) input back
+    error = InvalidCredentialFormatError()
+    return JSONResponse(
+        status_code=error.status_code,
+        content={
+            "status": "invalid",
+            "reason": error.reason,
+            "errors": [{"loc": err["loc"], "msg": err["msg"]} for err in exc.errors()],
+        },
+    )
+
+
 def register_exception_handlers(app):
     app.add_exception_handler(ExtensionValidationError, base_exception_handler)
+    app.add_exception_handler(RequestValidationError, validation_exception_handler)
@@ -1,26 +1,55 @@
 # extension_server.py
-import json
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 
 import uvicorn
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose.utils import base64url_decode
 
 from config import Config
-from exceptions.errors import InvalidTokenError, ChallengeMismatchError, InvalidCredentialFormatError
+from exceptions.errors import InvalidTokenError, ChallengeMismatchError
 from exceptions.handlers import register_exception_handlers
+from middleware.admission import AdmissionControlMiddleware
+from middleware.profiler import ProfileRequestMiddleware, profile_for, verify_admin_token
 from models \
     import ExtensionRegistrationResponse, ExtensionValidationResponse, ExtensionValidationRequest, \
     ExtensionRegistrationRequest
-from store.challenge import store_challenge, generate_challenge, pop_stored_challenge
-from utils.encoding import b64url_decode
+from store.challenge import store_challenge, generate_challenge, pop_stored_challenge, challenge_store_size, \
+    run_challenge_sweep
+from utils.log import dropped_log_records, log_event
+from utils.loop_monitor import loop_lag_monitor
+from utils.memory import memory_tracker
+from utils.responses import OrjsonResponse
 from validations.validate import validate_runtime_token
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    tasks = [asyncio.create_task(loop_lag_monitor.run()), asyncio.create_task(run_challenge_sweep())]
+    yield
+    for task in tasks:
+        task.cancel()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=OrjsonResponse)
 register_exception_handlers(app)
 
+# Innermost, so a profiled request samples the handler itself; nothing is installed without an admin token
+if Config.PROFILER_ADMIN_TOKEN:
+    app.add_middleware(ProfileRequestMiddleware)
+
+# Added before CORS so that 429/503 rejections still carry CORS headers
+app.add_middleware(
+    AdmissionControlMiddleware,
+    limited_paths=("/extensions/prepare", "/extensions/validate"),
+    username_paths=("/extensions/prepare", "/extensions/validate"),
+    exempt_paths=("/debug/profile", "/metrics/memory", "/metrics/loop-lag"),
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=Config.ALLOWED_ORIGINS,
@@ -42,7 +71,8 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
 @app.post("/extensions/prepare", response_model=ExtensionRegistrationResponse)
 async def prepare_registration_context(payload: ExtensionRegistrationRequest,
                                        extn_account_token: str = Depends(verify_token)):
-    user, account_id = await validate_runtime_token(extn_account_token, payload.username)
+    started = time.perf_counter()
+    user, account_id = validate_runtime_token(extn_account_token, payload.username)
 
     # Generate challenge (base64url-encoded)
     challenge = generate_challenge()
@@ -51,42 +81,63 @@ async def prepare_registration_context(payload: ExtensionRegistrationRequest,
     store_challenge(user, challenge)
 
     issued_at = int(datetime.now(timezone.utc).timestamp())
-    return {
+    log_event("extension_prepare_success", sampled=True, username=user, account_id=account_id,
+              duration_ms=round((time.perf_counter() - started) * 1000, 2))
+    return OrjsonResponse(content={
         "status": "valid",
         Config.USER_KEY: user,
         Config.ACCOUNT_ID_KEY: account_id,
         "challenge": challenge,
         "issued_at": issued_at,  # Unix timestamp
         "registered": True,  # example additional claim
-    }
+    })
 
 
 @app.post("/extensions/validate", response_model=ExtensionValidationResponse)
 async def validation_context(payload: ExtensionValidationRequest,
                              extn_account_token: str = Depends(verify_token)):
-    user, account_id = await validate_runtime_token(extn_account_token, payload.username)
+    started = time.perf_counter()
+    user, account_id = validate_runtime_token(extn_account_token, payload.username)
 
     stored_challenge = pop_stored_challenge(user)
     if not stored_challenge:
         raise ChallengeMismatchError()
 
-    # Bare-minimum validation: Check challenge round-trip
-    client_data_b64 = (payload.credential.get("response", {}).get("clientDataJSON"))
-    if not client_data_b64:
-        raise InvalidCredentialFormatError()
-
-    client_data_json = json.loads(b64url_decode(client_data_b64))
-    received_challenge = client_data_json.get("challenge")
+    # Bare-minimum validation: Check challenge round-trip (clientDataJSON was decoded during request validation)
+    received_challenge = payload.credential.response.clientDataJSON.challenge
 
     if received_challenge != stored_challenge:
         raise ChallengeMismatchError()
 
-    return {
+    log_event("extension_validation_success", sampled=True, username=user, account_id=account_id,
+              duration_ms=round((time.perf_counter() - started) * 1000, 2))
+    return OrjsonResponse(content={
         "status": "valid",
         Config.USER_KEY: user,
         Config.ACCOUNT_ID_KEY: account_id,
         "authenticated": True  # example additional claim
-    }
+    })
+
+
+@app.get("/metrics/loop-lag", dependencies=[Depends(verify_admin_token)])
+async def loop_lag():
+    return loop_lag_monitor.snapshot()
+
+
+@app.get("/metrics/memory", dependencies=[Depends(verify_admin_token)])
+async def memory():
+    # tracemalloc snapshots can take a while with many live allocations
+    report = await asyncio.to_thread(memory_tracker.report, {"challenges": challenge_store_size()})
+    report["dropped_log_records"] = dropped_log_records()
+    return report
+
+
+if Config.PROFILER_ADMIN_TOKEN:
+    @app.get("/debug/profile", response_class=PlainTextResponse, include_in_schema=False,
+             dependencies=[Depends(verify_admin_token)])
+    async def profile(seconds: float = Query(default=10, gt=0, le=Config.PROFILER_MAX_SECONDS)):
+        # Samples the whole process for `seconds` and returns collapsed stacks
+        return PlainTextResponse(await profile_for(seconds))
 
 
 if __name__ == "__main__":
@@ -8,7 +8,7 @@ from validations.validate import validate_runtime_token
 
 
 async def handle_extension_prepare(username: str, token: str) -> dict:
-    user, account_id = await validate_runtime_token(token)
+    user, account_id = validate_runtime_token(token)
 
     if user != username:
         raise HTTPException(
@@ -31,7 +31,7 @@ async def handle_extension_prepare(username: str, token: str) -> dict:
 
 
 async def handle_extension_validation(username: str, token: str, credential: dict) -> dict:
-    user, account_id = await validate_runtime_token(token)
+    user, account_id = validate_runtime_token(token)
 
     if user != username:
         raise HTTPException(
@@ -0,0 +1,181 @@
+# middleware/admission.py
+import asyncio
+import json
+import math
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by client identity (IP or username), held in a bounded LRU.
+
+    Only ever touched from the event loop thread, so no locking is needed and each
+    call is O(1): one dict lookup, one LRU reorder and at most one eviction.
+    """
+
+    def __init__(self, rate: float, burst: int, max_buckets: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()  # key -> [tokens, updated_at]
+
+    def acquire(self, key: str) -> float:
+        """
+        Takes one token for `key`.
+        Returns 0 when allowed, otherwise the number of seconds until a token is available.
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(self.burst), now]
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware applying, in order:
+      1. per-IP token buckets on `limited_paths` (429 + Retry-After)
+      2. concurrency-based load shedding on every request: once MAX_IN_FLIGHT_REQUESTS are running,
+         requests queue for at most MAX_QUEUE_WAIT_SECONDS (and at most MAX_QUEUED_REQUESTS of them)
+         before being shed with 503 + Retry-After
+      3. per-username token buckets on `username_paths`, keyed by the JSON body's `username` (429 + Retry-After).
+         The body is only read once admitted, and bodies over MAX_USERNAME_BODY_BYTES are rejected with 413
+
+    `exempt_paths` (the admin endpoints) bypass all of it: they must answer while the node is saturated,
+    and a long profile must not hold an in-flight slot.
+    """
+
+    def __init__(self, app, limited_paths: tuple[str, ...] = (), username_paths: tuple[str, ...] = (),
+                 exempt_paths: tuple[str, ...] = ()):
+        self.app = app
+        self.limited_paths = frozenset(limited_paths)
+        self.username_paths = frozenset(username_paths)
+        self.exempt_paths = frozenset(exempt_paths)
+
+        self.ip_limiter = TokenBucketLimiter(
+            Config.RATE_LIMIT_IP_PER_SECOND, Config.RATE_LIMIT_IP_BURST, Config.RATE_LIMIT_MAX_BUCKETS
+        )
+        self.user_limiter = TokenBucketLimiter(
+            Config.RATE_LIMIT_USER_PER_SECOND, Config.RATE_LIMIT_USER_BURST, Config.RATE_LIMIT_MAX_BUCKETS
+        )
+
+        self._slots = asyncio.Semaphore(Config.MAX_IN_FLIGHT_REQUESTS)
+        self._queued = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        if path in self.limited_paths:
+            client = scope.get("client")
+            retry_after = self.ip_limiter.acquire(client[0] if client else "unknown")
+            if retry_after:
+                await _reject(send, 429, retry_after, "Too many requests")
+                return
+
+        if not await self._admit():
+            await _reject(send, 503, Config.MAX_QUEUE_WAIT_SECONDS, "Server busy")
+            return
+
+        try:
+            if path in self.username_paths:
+                body, receive = await _buffer_body(scope, receive, Config.MAX_USERNAME_BODY_BYTES)
+                if body is None:
+                    await _reject(send, 413, None, "Request body too large")
+                    return
+                username = _extract_username(body)
+                if username:
+                    retry_after = self.user_limiter.acquire(username)
+                    if retry_after:
+                        await _reject(send, 429, retry_after, "Too many requests")
+                        return
+
+            await self.app(scope, receive, send)
+        finally:
+            self._slots.release()
+
+    async def _admit(self) -> bool:
+        if not self._slots.locked():
+            await self._slots.acquire()  # a slot is free, returns immediately
+            return True
+
+        if self._queued >= Config.MAX_QUEUED_REQUESTS:
+            return False
+
+        self._queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), Config.MAX_QUEUE_WAIT_SECONDS)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._queued -= 1
+
+
+async def _buffer_body(scope, receive, max_bytes: int):
+    """
+    Reads the full request body and returns it with a `receive` callable that replays it downstream.
+    Returns None as the body, without reading further, once it is known to exceed `max_bytes`.
+    """
+    for name, value in scope["headers"]:
+        if name == b"content-length" and value.isdigit() and int(value) > max_bytes:
+            return None, receive
+
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > max_bytes:  # chunked, or a content-length that understates the body
+            return None, receive
+        chunks.append(chunk)
+        more_body = message.get("more_body", False)
+    body = b"".join(chunks)
+
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+def _extract_username(body: bytes) -> str | None:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    username = payload.get("username") if isinstance(payload, dict) else None
+    return username if isinstance(username, str) else None
+
+
+async def _reject(send, status: int, retry_after: float | None, detail: str):
+    headers = [(b"content-type", b"application/json")]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(max(1, math.ceil(retry_after))).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
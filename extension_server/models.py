@@ -1,4 +1,38 @@
-from pydantic import BaseModel
+import json
+from typing import Annotated
+
+from pydantic import BaseModel, BeforeValidator
+
+from config import Config
+from utils.encoding import b64url_decode
+
+
+def _decode_client_data(value):
+    """
+    Base64url-decodes and parses clientDataJSON exactly once, rejecting oversized input before decoding.
+    """
+    if not isinstance(value, str):
+        raise ValueError("must be a base64url string")
+    if len(value) > (Config.MAX_CLIENT_DATA_BYTES * 4 + 2) // 3:
+        raise ValueError(f"exceeds {Config.MAX_CLIENT_DATA_BYTES} bytes")
+    try:
+        return json.loads(b64url_decode(value))
+    except ValueError as e:
+        raise ValueError("malformed value") from e
+
+
+class ClientData(BaseModel):
+    type: str
+    challenge: str
+    origin: str
+
+
+class CredentialResponse(BaseModel):
+    clientDataJSON: Annotated[ClientData, BeforeValidator(_decode_client_data)]
+
+
+class ExtensionCredential(BaseModel):
+    response: CredentialResponse
 
 
 class ExtensionRegistrationRequest(BaseModel):
@@ -16,7 +50,7 @@ class ExtensionRegistrationResponse(BaseModel):
 
 class ExtensionValidationRequest(BaseModel):
     username: str
-    credential: dict
+    credential: ExtensionCredential
 
 
 class ExtensionValidationResponse(BaseModel):
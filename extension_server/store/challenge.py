@@ -1,9 +1,11 @@
 # store/challenge.py
+import asyncio
 import os
 import time
 import base64
 
 from config import Config
+from utils.log import log_event
 
 # In-memory challenge store: { username: (challenge, expiry_time) }
 _challenge_store = {}
@@ -46,3 +48,27 @@ def pop_stored_challenge(user: str) -> str | None:
         return None  # expired
 
     return challenge
+
+
+def prune_expired_challenges() -> int:
+    """
+    Drops expired challenges. Abandoned ceremonies never pop theirs, so without this sweep
+    the store grows with every distinct user that never completes validation.
+    """
+    now = time.time()
+    expired = [user for user, (_, expires_at) in list(_challenge_store.items()) if now > expires_at]
+    for user in expired:
+        _challenge_store.pop(user, None)
+    return len(expired)
+
+
+def challenge_store_size() -> int:
+    return len(_challenge_store)
+
+
+async def run_challenge_sweep():
+    while True:
+        await asyncio.sleep(Config.CHALLENGE_SWEEP_INTERVAL_SECONDS)
+        pruned = prune_expired_challenges()
+        if pruned:
+            log_event("challenge_sweep", pruned=pruned, remaining=len(_challenge_store))
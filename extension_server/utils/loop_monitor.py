@@ -0,0 +1,41 @@
+import asyncio
+import logging
+from collections import deque
+
+from config import Config
+from utils.log import log_event
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag: how late a periodic sleep wakes up compared to when it was scheduled.
+    """
+
+    def __init__(self, interval_seconds: float, window: int = 600):
+        self.interval_seconds = interval_seconds
+        self.samples: deque[float] = deque(maxlen=window)  # lag in ms, most recent last
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval_seconds)
+            lag_ms = max(0.0, (loop.time() - started - self.interval_seconds) * 1000)
+            self.samples.append(lag_ms)
+            if lag_ms > Config.LOOP_LAG_WARN_MS:
+                log_event("event_loop_lag", level=logging.WARNING, lag_ms=round(lag_ms, 2))
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"samples": 0, "last_ms": 0.0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        return {
+            "samples": len(ordered),
+            "last_ms": round(self.samples[-1], 2),
+            "p50_ms": round(ordered[len(ordered) // 2], 2),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+            "max_ms": round(ordered[-1], 2),
+        }
+
+
+loop_lag_monitor = LoopLagMonitor(Config.LOOP_LAG_INTERVAL_SECONDS)
@@ -5,7 +5,9 @@ from config import Config
 from exceptions.errors import TokenExpiredError, MissingClaimsError, InvalidTokenError, UsernameMismatchError
 
 
-async def validate_runtime_token(token, current_user: str) -> tuple[str, str]:
+def validate_runtime_token(token, current_user: str) -> tuple[str, str]:
+    # Called inline from the async handlers: an HS256 check takes ~50µs and holds the GIL, so a thread
+    # or process pool only adds hand-off cost (see benchmarks/token_validation.py)
     try:
         # Decode and verify the JWT (signature + expiry)
         payload = jwt.decode(
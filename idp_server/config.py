@@ -13,6 +13,33 @@ class Config:
     JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
     JWT_EXPIRY_SECONDS = int(os.getenv("JWT_EXPIRY", "60"))  # Default to 60 seconds
 
+    # Admission control (per-IP / per-username token buckets, load shedding)
+    RATE_LIMIT_IP_PER_SECOND = float(os.getenv("RATE_LIMIT_IP_PER_SECOND", "10"))
+    RATE_LIMIT_IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", "20"))
+    RATE_LIMIT_USER_PER_SECOND = float(os.getenv("RATE_LIMIT_USER_PER_SECOND", "1"))
+    RATE_LIMIT_USER_BURST = int(os.getenv("RATE_LIMIT_USER_BURST", "5"))
+    RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "10000"))
+    MAX_IN_FLIGHT_REQUESTS = int(os.getenv("MAX_IN_FLIGHT_REQUESTS", "64"))
+    MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "128"))
+    MAX_QUEUE_WAIT_SECONDS = float(os.getenv("MAX_QUEUE_WAIT_SECONDS", "0.5"))
+    MAX_USERNAME_BODY_BYTES = int(os.getenv("MAX_USERNAME_BODY_BYTES", "1024"))  # Read for the username; 413 above
+
+    # Sampling profiler (GET /debug/profile, X-Profile-Token header); disabled unless an admin token is set.
+    # The admin token also guards GET /metrics/memory.
+    PROFILER_ADMIN_TOKEN = os.getenv("PROFILER_ADMIN_TOKEN")
+    PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+    PROFILER_MAX_SECONDS = int(os.getenv("PROFILER_MAX_SECONDS", "60"))
+    PROFILER_MAX_DEPTH = int(os.getenv("PROFILER_MAX_DEPTH", "64"))
+
+    # Memory instrumentation (GET /metrics/memory, requires X-Admin-Token)
+    TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "0"))  # Traceback depth; 0 disables allocation tracing
+    MEMORY_TOP_ALLOCATIONS = int(os.getenv("MEMORY_TOP_ALLOCATIONS", "10"))
+
+    # Logging
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_SUCCESS_SAMPLE_RATE = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", "1.0"))  # Fraction of success events kept
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
     # CORS (optional)
     ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 
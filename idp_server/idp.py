@@ -1,17 +1,35 @@
 import base64
+import time
 from datetime import datetime, timezone
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from config import Config
 from database.users_stub import USERS
+from log import dropped_log_records, log_event
+from memory import memory_tracker
+from middleware.admission import AdmissionControlMiddleware
+from middleware.profiler import ProfileRequestMiddleware, profile_for, verify_admin_token
 from models import TokenRequest, TokenResponse
+from responses import OrjsonResponse
 from utils import create_jwt_token
 
-app = FastAPI()
+app = FastAPI(default_response_class=OrjsonResponse)
+
+# Innermost, so a profiled request samples the handler itself; nothing is installed without an admin token
+if Config.PROFILER_ADMIN_TOKEN:
+    app.add_middleware(ProfileRequestMiddleware)
+
+# Added before CORS so that 429/503 rejections still carry CORS headers
+app.add_middleware(
+    AdmissionControlMiddleware,
+    limited_paths=("/token/generate",),
+    username_paths=("/token/generate",),
+    exempt_paths=("/debug/profile", "/metrics/memory"),
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,6 +41,7 @@ app.add_middleware(
 
 @app.post("/token/generate", response_model=TokenResponse)
 def generate_token(payload: TokenRequest):
+    started = time.perf_counter()
     user = USERS.get(payload.username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -55,7 +74,24 @@ def generate_token(payload: TokenRequest):
     encoded_jwt_rp = create_jwt_token(base_token_data.copy(), Config.JWT_AUDIENCE_RP)
     encoded_jwt_extn = create_jwt_token(base_token_data.copy(), Config.JWT_AUDIENCE_EXTN)
 
-    return {"token_rp": encoded_jwt_rp, "token_extn": encoded_jwt_extn}
+    log_event("token_issued", sampled=True, username=payload.username, account_id=payload.account_id,
+              duration_ms=round((time.perf_counter() - started) * 1000, 2))
+    return OrjsonResponse(content={"token_rp": encoded_jwt_rp, "token_extn": encoded_jwt_extn})
+
+
+@app.get("/metrics/memory", dependencies=[Depends(verify_admin_token)])
+def memory():
+    report = memory_tracker.report({"users": len(USERS)})
+    report["dropped_log_records"] = dropped_log_records()
+    return report
+
+
+if Config.PROFILER_ADMIN_TOKEN:
+    @app.get("/debug/profile", response_class=PlainTextResponse, include_in_schema=False,
+             dependencies=[Depends(verify_admin_token)])
+    async def profile(seconds: float = Query(default=10, gt=0, le=Config.PROFILER_MAX_SECONDS)):
+        # Samples the whole process for `seconds` and returns collapsed stacks
+        return PlainTextResponse(await profile_for(seconds))
 
 
 @app.exception_handler(Exception)
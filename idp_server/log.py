@@ -0,0 +1,103 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from config import Config
+
+
+class JsonFormatter(logging.Formatter):
+    """Renders a record as one JSON object per line, merging in structured `fields`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        return json.dumps(entry, default=str)
+
+
+class SuccessSampler(logging.Filter):
+    """Keeps a fraction of records flagged `sampled`; everything else always passes."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Never blocks the caller: when the queue is full the record is dropped and counted. The next record that
+    fits is preceded by a `log_records_dropped` warning carrying the number dropped since the previous one.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._reported = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # Called with the handler lock held, so the counters need no extra locking
+        try:
+            if self.dropped > self._reported:
+                missed = self.dropped - self._reported
+                self.queue.put_nowait(_dropped_record(record.name, missed))
+                self._reported += missed
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _dropped_record(name: str, count: int) -> logging.LogRecord:
+    record = logging.LogRecord(name, logging.WARNING, __file__, 0, "log_records_dropped", None, None)
+    record.fields = {"count": count}
+    return record
+
+
+def setup_logging(name: str) -> logging.Logger:
+    """
+    Routes `name` through a bounded queue to a background thread that writes JSON lines to stdout,
+    so request threads never wait on stdout.
+    """
+    log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SuccessSampler(Config.LOG_SUCCESS_SAMPLE_RATE))
+
+    log = logging.getLogger(name)
+    log.setLevel(Config.LOG_LEVEL)
+    log.addHandler(queue_handler)
+    log.propagate = False
+    return log
+
+
+def log_event(event: str, *, level: int = logging.INFO, sampled: bool = False, **fields) -> None:
+    """
+    Logs a structured event. `sampled=True` marks high-volume success events subject to LOG_SUCCESS_SAMPLE_RATE.
+    """
+    logger.log(level, event, extra={"fields": fields, "sampled": sampled})
+
+
+def dropped_log_records() -> int:
+    """Records dropped because the log queue was full, since startup."""
+    return sum(getattr(handler, "dropped", 0) for handler in logger.handlers)
+
+
+logger = setup_logging("idp_server")
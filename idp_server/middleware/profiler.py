@@ -0,0 +1,174 @@
+# middleware/profiler.py
+import asyncio
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from fastapi import Header, HTTPException
+
+from config import Config
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's Python stack from a background thread and aggregates them as collapsed stacks
+    (`thread;outer;...;inner count`), ready for flamegraph.pl or speedscope.
+
+    Nothing runs unless a profile is in progress. Each sample only walks frame objects and bumps a
+    counter (labels are cached per code object), so the GIL is held for microseconds per tick; the
+    sampler sleeps, releasing the GIL, between ticks.
+    """
+
+    def __init__(self, interval: float, max_depth: int):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Counter[tuple[str, ...]] = Counter()
+        self.sample_count = 0
+        self._labels: dict = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        return self.collapsed()
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        labels = self._labels
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = _frame_label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[tuple(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+
+# Only one profile at a time: concurrent samplers would just distort each other
+_profile_lock = threading.Lock()
+
+
+def start_profiler() -> SamplingProfiler | None:
+    """Starts a profiler, or returns None if one is already running."""
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        profiler = SamplingProfiler(Config.PROFILER_INTERVAL_MS / 1000, Config.PROFILER_MAX_DEPTH)
+        profiler.start()
+    except Exception:
+        _profile_lock.release()
+        raise
+    return profiler
+
+
+def stop_profiler(profiler: SamplingProfiler) -> str:
+    try:
+        return profiler.stop()
+    finally:
+        _profile_lock.release()
+
+
+async def profile_for(seconds: float) -> str:
+    profiler = start_profiler()
+    if profiler is None:
+        raise HTTPException(status_code=409, detail="A profile is already in progress")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        output = stop_profiler(profiler)
+    return output
+
+
+def is_admin_token(token: str | None) -> bool:
+    # Without a configured admin token nothing is accepted
+    if not token or not Config.PROFILER_ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(token.encode(), Config.PROFILER_ADMIN_TOKEN.encode())
+
+
+# Dependency guarding the admin endpoints (/debug/profile, /metrics/memory)
+def verify_admin_token(x_admin_token: str | None = Header(default=None)) -> None:
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+class ProfileRequestMiddleware:
+    """
+    Profiles single requests carrying the admin token in the X-Profile-Token header.
+
+    The handler's response is discarded and replaced with the collapsed stacks sampled while it ran
+    (its status is kept in X-Profiled-Status). The whole process is sampled, so concurrent requests show
+    up too. Only installed when PROFILER_ADMIN_TOKEN is set, so it costs nothing otherwise.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile-token":
+                token = value.decode("latin-1")
+                break
+        if token is None:
+            return await self.app(scope, receive, send)
+
+        if not is_admin_token(token):
+            return await _respond(send, 403, "application/json", json.dumps({"detail": "Admin token required"}))
+        profiler = start_profiler()
+        if profiler is None:
+            return await _respond(send, 409, "application/json",
+                                  json.dumps({"detail": "A profile is already in progress"}))
+
+        status = {"code": 500}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            output = stop_profiler(profiler)
+        await _respond(send, 200, "text/plain; charset=utf-8", output, [
+            (b"x-profiled-status", str(status["code"]).encode()),
+            (b"x-profiled-duration-ms", f"{(time.perf_counter() - started) * 1000:.2f}".encode()),
+            (b"x-profile-samples", str(profiler.sample_count).encode()),
+        ])
+
+
+async def _respond(send, status: int, content_type: str, body: str, headers: list | None = None):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode())] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": body.encode()})
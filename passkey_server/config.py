@@ -19,6 +19,80 @@ class Config:
     JWT_EXPIRY_SECONDS = int(os.getenv("JWT_EXPIRY", "60"))  # Default to 60 seconds
     JWT_LEEWAY_SECONDS = 30
 
+    # Multi-tenant relying parties (optional). JSON list, e.g.
+    # [{"id": "a.example.com", "name": "A", "hosts": ["a.example.com"], "accounts": ["acc001"],
+    #   "max_credentials_per_user": 5}]
+    # When unset, the single RP_ID / RP_NAME relying party above serves every request.
+    RP_TENANTS = os.getenv("RP_TENANTS")
+    RP_SERVER_CACHE_SIZE = int(os.getenv("RP_SERVER_CACHE_SIZE", "64"))
+
+    # Request payload limits (decoded bytes)
+    MAX_CREDENTIAL_ID_BYTES = 1023
+    MAX_CLIENT_DATA_BYTES = int(os.getenv("MAX_CLIENT_DATA_BYTES", "4096"))
+    MAX_ATTESTATION_OBJECT_BYTES = int(os.getenv("MAX_ATTESTATION_OBJECT_BYTES", "16384"))
+    MAX_AUTHENTICATOR_DATA_BYTES = int(os.getenv("MAX_AUTHENTICATOR_DATA_BYTES", "2048"))
+    MAX_SIGNATURE_BYTES = 1024
+    MAX_USER_HANDLE_BYTES = 64
+
+    # Credential lifecycle
+    MAX_CREDENTIALS_PER_USER = int(os.getenv("MAX_CREDENTIALS_PER_USER", "10"))
+    CREDENTIAL_MAX_IDLE_SECONDS = int(os.getenv("CREDENTIAL_MAX_IDLE_SECONDS", str(180 * 24 * 3600)))  # 180 days
+    CREDENTIAL_COMPACTION_INTERVAL_SECONDS = int(os.getenv("CREDENTIAL_COMPACTION_INTERVAL", "3600"))
+    ALLOW_CREDENTIALS_CACHE_SIZE = int(os.getenv("ALLOW_CREDENTIALS_CACHE_SIZE", "10000"))
+
+    # Admission control (per-IP / per-username token buckets, load shedding)
+    RATE_LIMIT_IP_PER_SECOND = float(os.getenv("RATE_LIMIT_IP_PER_SECOND", "10"))
+    RATE_LIMIT_IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", "20"))
+    RATE_LIMIT_USER_PER_SECOND = float(os.getenv("RATE_LIMIT_USER_PER_SECOND", "1"))
+    RATE_LIMIT_USER_BURST = int(os.getenv("RATE_LIMIT_USER_BURST", "5"))
+    RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "10000"))
+    MAX_IN_FLIGHT_REQUESTS = int(os.getenv("MAX_IN_FLIGHT_REQUESTS", "64"))
+    MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "128"))
+    MAX_QUEUE_WAIT_SECONDS = float(os.getenv("MAX_QUEUE_WAIT_SECONDS", "0.5"))
+    MAX_USERNAME_BODY_BYTES = int(os.getenv("MAX_USERNAME_BODY_BYTES", "1024"))  # Read for the username; 413 above
+
+    # Attestation metadata (FIDO MDS3 blob); attestation is not verified when unset
+    MDS_BLOB_PATH = os.getenv("MDS_BLOB_PATH")
+    MDS_TRUST_ROOT_PATH = os.getenv("MDS_TRUST_ROOT_PATH")  # DER root used to verify the blob signature
+    # Skips the blob signature check; only for local testing with self-made blobs
+    MDS_ALLOW_UNSIGNED_BLOB = os.getenv("MDS_ALLOW_UNSIGNED_BLOB", "false").lower() == "true"
+    MDS_RELOAD_INTERVAL_SECONDS = int(os.getenv("MDS_RELOAD_INTERVAL", "60"))
+    # "none" and self attestation carry no certificate chain: reject them (default), allow them only for
+    # authenticators not listed in the blob ("unlisted"), or always allow them ("allow")
+    MDS_UNATTESTED_POLICY = os.getenv("MDS_UNATTESTED_POLICY", "reject")
+    ATTESTATION_CACHE_SIZE = int(os.getenv("ATTESTATION_CACHE_SIZE", "1024"))
+
+    # Session resumption after authentication (disabled unless audiences are listed)
+    SESSION_AUDIENCES = [aud for aud in os.getenv("SESSION_AUDIENCES", "").split(",") if aud]
+    SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "300"))
+    SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+
+    # Server-to-server extension validation (optional). When set, the ceremony endpoints call the
+    # extension server themselves with the token from the X-Extension-Token header.
+    EXTENSION_SERVER_URL = os.getenv("EXTENSION_SERVER_URL")
+    EXTENSION_TIMEOUT_SECONDS = float(os.getenv("EXTENSION_TIMEOUT_SECONDS", "2.0"))
+    EXTENSION_CONNECT_TIMEOUT_SECONDS = float(os.getenv("EXTENSION_CONNECT_TIMEOUT_SECONDS", "0.5"))
+    EXTENSION_MAX_CONNECTIONS = int(os.getenv("EXTENSION_MAX_CONNECTIONS", "32"))
+    EXTENSION_MAX_CONCURRENCY = int(os.getenv("EXTENSION_MAX_CONCURRENCY", "32"))
+    EXTENSION_BREAKER_FAILURES = int(os.getenv("EXTENSION_BREAKER_FAILURES", "5"))
+    EXTENSION_BREAKER_RESET_SECONDS = float(os.getenv("EXTENSION_BREAKER_RESET_SECONDS", "30"))
+
+    # Sampling profiler (GET /debug/profile, X-Profile-Token header); disabled unless an admin token is set.
+    # The admin token also guards GET /metrics/memory.
+    PROFILER_ADMIN_TOKEN = os.getenv("PROFILER_ADMIN_TOKEN")
+    PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+    PROFILER_MAX_SECONDS = int(os.getenv("PROFILER_MAX_SECONDS", "60"))
+    PROFILER_MAX_DEPTH = int(os.getenv("PROFILER_MAX_DEPTH", "64"))
+
+    # Memory instrumentation (GET /metrics/memory, requires X-Admin-Token)
+    TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "0"))  # Traceback depth; 0 disables allocation tracing
+    MEMORY_TOP_ALLOCATIONS = int(os.getenv("MEMORY_TOP_ALLOCATIONS", "10"))
+
+    # Logging
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_SUCCESS_SAMPLE_RATE = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", "1.0"))  # Fraction of success events kept
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
     # CORS (optional)
     ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 
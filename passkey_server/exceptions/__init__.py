@@ -3,3 +3,10 @@ class ExtensionValidationError(Exception):
     def __init__(self, message: str, *, cause: Exception = None):
         super().__init__(message)
         self.cause = cause
+
+
+class ExtensionUnavailableError(Exception):
+    """Raised when the extension server cannot be reached (timeout, overload or open circuit)."""
+    def __init__(self, message: str, *, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
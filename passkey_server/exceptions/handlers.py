@@ -2,9 +2,10 @@ from fastapi import Request
 from fastapi.responses import JSONResponse
 
 from fastapi.exceptions import RequestValidationError, HTTPException
-from starlette.status import HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_500_INTERNAL_SERVER_ERROR
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_500_INTERNAL_SERVER_ERROR, \
+    HTTP_503_SERVICE_UNAVAILABLE
 
-from exceptions import ExtensionValidationError
+from exceptions import ExtensionValidationError, ExtensionUnavailableError
 
 
 async def handle_http_exception(request: Request, exc: HTTPException):
@@ -12,13 +13,20 @@ async def handle_http_exception(request: Request, exc: HTTPException):
 
 
 async def handle_validation_exception(request: Request, exc: RequestValidationError):
-    return JSONResponse(status_code=HTTP_400_BAD_REQUEST, content={"detail": exc.errors()})
+    # Only location and message: never echo (possibly oversized) input back
+    errors = [{"loc": error["loc"], "msg": error["msg"], "type": error["type"]} for error in exc.errors()]
+    return JSONResponse(status_code=HTTP_400_BAD_REQUEST, content={"detail": errors})
 
 
 async def handle_extension_validation_exception(request: Request, exc: ExtensionValidationError):
     return JSONResponse(status_code=HTTP_401_UNAUTHORIZED, content={"detail": str(exc)})
 
 
+async def handle_extension_unavailable_exception(request: Request, exc: ExtensionUnavailableError):
+    headers = {"Retry-After": str(max(1, round(exc.retry_after)))} if exc.retry_after else None
+    return JSONResponse(status_code=HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)}, headers=headers)
+
+
 async def handle_generic_bad_request(request: Request, exc: ValueError):
     return JSONResponse(status_code=HTTP_400_BAD_REQUEST, content={"detail": str(exc)})
 
@@ -31,5 +39,6 @@ def register_exception_handlers(app):
     app.add_exception_handler(HTTPException, handle_http_exception)
     app.add_exception_handler(RequestValidationError, handle_validation_exception)
     app.add_exception_handler(ExtensionValidationError, handle_extension_validation_exception)
+    app.add_exception_handler(ExtensionUnavailableError, handle_extension_unavailable_exception)
     app.add_exception_handler(ValueError, handle_generic_bad_request)
     app.add_exception_handler(Exception, handle_generic_exception)
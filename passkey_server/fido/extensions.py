@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+import httpx
+
+from config import Config
+from exceptions import ExtensionValidationError, ExtensionUnavailableError
+from utils.encoding import b64url_decode
+from utils.log import log_event
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `reset_seconds`.
+    Once that elapses a single trial call is let through: success closes the circuit, failure re-opens it.
+    Only touched from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+
+    def retry_after(self) -> float:
+        """Returns 0 if a call may proceed, otherwise the seconds until the next trial."""
+        if self.opened_at is None:
+            return 0
+        remaining = self.opened_at + self.reset_seconds - time.monotonic()
+        if remaining > 0:
+            return remaining
+        if self.trial_in_flight:
+            return self.reset_seconds
+        self.trial_in_flight = True
+        return 0
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                log_event("extension_circuit_opened", level=logging.WARNING, failures=self.failures)
+            self.opened_at = time.monotonic()
+
+
+def _rejection_reason(response: httpx.Response) -> str:
+    """
+    Extracts the reason from an extension server rejection: `{"status": "invalid", "reason": ...}`
+    for its own errors, `{"detail": ...}` for framework-level ones (missing bearer token, bad body).
+    """
+    try:
+        body = response.json()
+    except ValueError:
+        return "Extension validation failed"
+    if isinstance(body, dict):
+        reason = body.get("reason") or body.get("detail")
+        if isinstance(reason, str):
+            return reason
+    return "Extension validation failed"
+
+
+class ExtensionClient:
+    """
+    Calls the extension server's /extensions/prepare and /extensions/validate endpoints on behalf of the
+    browser, over a pooled keep-alive connection, with bounded concurrency and a circuit breaker.
+
+    Rejections by the extension server (4xx) raise ExtensionValidationError; timeouts, transport errors,
+    5xx/429 responses and an open circuit raise ExtensionUnavailableError.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.breaker = CircuitBreaker(Config.EXTENSION_BREAKER_FAILURES, Config.EXTENSION_BREAKER_RESET_SECONDS)
+        self._semaphore = asyncio.Semaphore(Config.EXTENSION_MAX_CONCURRENCY)
+        self._client: httpx.AsyncClient | None = None
+
+    def open(self, transport: httpx.AsyncBaseTransport | None = None) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            transport=transport,
+            timeout=httpx.Timeout(Config.EXTENSION_TIMEOUT_SECONDS, connect=Config.EXTENSION_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=Config.EXTENSION_MAX_CONNECTIONS,
+                                max_keepalive_connections=Config.EXTENSION_MAX_CONNECTIONS),
+        )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(self, path: str, extension_token: str, body: dict) -> dict:
+        retry_after = self.breaker.retry_after()
+        if retry_after:
+            raise ExtensionUnavailableError("Extension server unavailable", retry_after=retry_after)
+
+        try:
+            # Waiting for a slot counts against the same budget as the call itself
+            async with asyncio.timeout(Config.EXTENSION_TIMEOUT_SECONDS):
+                async with self._semaphore:
+                    response = await self._client.post(
+                        path, json=body, headers={"Authorization": f"Bearer {extension_token}"}
+                    )
+        except (TimeoutError, httpx.HTTPError) as e:
+            self.breaker.record_failure()
+            log_event("extension_call_failed", level=logging.WARNING, path=path, error=type(e).__name__)
+            raise ExtensionUnavailableError("Extension server unavailable") from e
+
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+            log_event("extension_call_failed", level=logging.WARNING, path=path, status=response.status_code)
+            raise ExtensionUnavailableError("Extension server unavailable")
+
+        self.breaker.record_success()
+        if response.status_code != 200:
+            raise ExtensionValidationError(_rejection_reason(response))
+        return response.json()
+
+    async def prepare(self, username: str, extension_token: str) -> bytes:
+        """Asks the extension server for a challenge, which is then used as the WebAuthn challenge."""
+        result = await self._post("/extensions/prepare", extension_token, {"username": username})
+        return b64url_decode(result["challenge"])
+
+    async def validate(self, username: str, extension_token: str, client_data_json: str) -> None:
+        await self._post("/extensions/validate", extension_token, {
+            "username": username,
+            "credential": {"response": {"clientDataJSON": client_data_json}},
+        })
+
+    def start_validation(self, extension_token: str, client_data_json: str) -> Callable[[str], Future]:
+        """
+        Must be called on the event loop. Returns a callable for the (threaded) ceremony code that schedules
+        the validation call on the loop once the username is known and returns a future to wait on before
+        anything is persisted, so the extension round trip overlaps with WebAuthn verification.
+        """
+        loop = asyncio.get_running_loop()
+
+        def start(username: str) -> Future:
+            return asyncio.run_coroutine_threadsafe(
+                self.validate(username, extension_token, client_data_json), loop
+            )
+
+        return start
+
+
+def create_extension_client() -> ExtensionClient | None:
+    if not Config.EXTENSION_SERVER_URL:
+        return None
+    return ExtensionClient(Config.EXTENSION_SERVER_URL)
@@ -0,0 +1,37 @@
+import asyncio
+
+from config import Config
+from fido.metadata import MetadataAttestationVerifier
+from fido.sessions import prune_expired_sessions
+from fido.store import compact_credentials
+from utils.log import log_event
+
+
+async def run_credential_compaction():
+    """
+    Periodically evicts stale credentials so per-user allowCredentials lists stay bounded.
+    """
+    while True:
+        await asyncio.sleep(Config.CREDENTIAL_COMPACTION_INTERVAL_SECONDS)
+        stats = await asyncio.to_thread(compact_credentials, Config.CREDENTIAL_MAX_IDLE_SECONDS)
+        log_event("credential_compaction", **stats)
+
+
+async def run_metadata_reload(verifier: MetadataAttestationVerifier):
+    """
+    Reloads the attestation metadata blob when the file on disk changes.
+    """
+    while True:
+        await asyncio.sleep(Config.MDS_RELOAD_INTERVAL_SECONDS)
+        await asyncio.to_thread(verifier.reload_if_changed)
+
+
+async def run_session_prune():
+    """
+    Drops expired resumable sessions, so the cache only holds live ones between issuances.
+    """
+    while True:
+        await asyncio.sleep(Config.SESSION_TTL_SECONDS)
+        pruned = prune_expired_sessions()
+        if pruned:
+            log_event("session_prune", pruned=pruned)
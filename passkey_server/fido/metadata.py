@@ -0,0 +1,191 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple
+
+from cryptography import x509
+from fido2.attestation import (
+    AttestationVerifier, NoneAttestation, UnsupportedAttestation, UntrustedAttestation, InvalidSignature,
+    verify_x509_chain,
+)
+from fido2.mds3 import AuthenticatorStatus, filter_revoked, parse_blob
+from fido2.webauthn import Aaguid, AttestationObject
+
+from config import Config
+from utils.log import log_event
+
+
+class TrustAnchor(NamedTuple):
+    subject: x509.Name
+    der: bytes
+
+
+class MetadataEntry(NamedTuple):
+    description: str
+    roots: list[TrustAnchor]
+    compromised_certificates: frozenset[bytes]
+
+
+class MetadataSnapshot:
+    """
+    An immutable AAGUID -> MetadataEntry table plus its chain validation cache.
+    Swapped as a whole on reload, so readers never see a half-built table or stale cache entries.
+    """
+
+    def __init__(self, entries: Dict[Aaguid, MetadataEntry], mtime: float | None):
+        self.entries = entries
+        self.mtime = mtime
+        self.chain_cache: OrderedDict[tuple[Aaguid, bytes], bool] = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+
+def _build_entries(blob: Any) -> Dict[Aaguid, MetadataEntry]:
+    entries = {}
+    for entry in blob.entries:
+        if not entry.aaguid or not entry.metadata_statement or not filter_revoked(entry):
+            continue
+
+        roots = []
+        for der in entry.metadata_statement.attestation_root_certificates:
+            cert = x509.load_der_x509_certificate(der)
+            roots.append(TrustAnchor(subject=cert.subject, der=der))
+
+        compromised = frozenset(
+            report.certificate
+            for report in entry.status_reports
+            if report.status == AuthenticatorStatus.ATTESTATION_KEY_COMPROMISE and report.certificate
+        )
+        entries[entry.aaguid] = MetadataEntry(
+            description=entry.metadata_statement.description,
+            roots=roots,
+            compromised_certificates=compromised,
+        )
+    return entries
+
+
+class MetadataAttestationVerifier(AttestationVerifier):
+    """
+    Verifies attestation against a local FIDO MDS3 blob.
+
+    The blob is parsed once into an AAGUID-indexed table with pre-parsed root certificates.
+    Certificate chain validation results are cached per (AAGUID, leaf certificate hash);
+    the attestation statement signature itself is still checked on every registration.
+    """
+
+    def __init__(self, blob_path: str, trust_root_path: str | None = None):
+        super().__init__()
+        self.blob_path = blob_path
+        self.trust_root_path = trust_root_path
+        self._snapshot = MetadataSnapshot({}, None)
+        self.load()
+
+    def load(self) -> None:
+        """Parses the blob and atomically replaces the current snapshot."""
+        mtime = os.path.getmtime(self.blob_path)
+        with open(self.blob_path, "rb") as f:
+            blob = f.read()
+        trust_root = None
+        if self.trust_root_path:
+            with open(self.trust_root_path, "rb") as f:
+                trust_root = f.read()
+
+        snapshot = MetadataSnapshot(_build_entries(parse_blob(blob, trust_root)), mtime)
+        self._snapshot = snapshot
+        log_event("metadata_loaded", path=self.blob_path, entries=len(snapshot.entries))
+
+    def reload_if_changed(self) -> bool:
+        try:
+            if os.path.getmtime(self.blob_path) == self._snapshot.mtime:
+                return False
+            self.load()
+            return True
+        except Exception as e:
+            # Keep serving the previous snapshot
+            log_event("metadata_reload_failed", path=self.blob_path, error=str(e))
+            return False
+
+    def ca_lookup(self, attestation_result, auth_data) -> bytes | None:
+        entry = self._snapshot.entries.get(auth_data.credential_data.aaguid)
+        if entry is None or not attestation_result.trust_path:
+            return None
+        issuer = x509.load_der_x509_certificate(attestation_result.trust_path[-1]).issuer
+        for root in entry.roots:
+            if root.subject == issuer:
+                return root.der
+        return None
+
+    def verify_attestation(self, attestation_object: AttestationObject, client_data_hash: bytes) -> None:
+        # 1. Verify the attestation statement itself (always, it signs this ceremony's client data).
+        #    fido2 leaves "none" out of the default formats; it is checked here and left to the policy below.
+        fmt = attestation_object.fmt
+        att_verifier = NoneAttestation() if fmt == "none" else UnsupportedAttestation(fmt)
+        for at in self._attestation_types:
+            if getattr(at, "FORMAT", None) == fmt:
+                att_verifier = at
+                break
+        result = att_verifier.verify(attestation_object.att_stmt, attestation_object.auth_data, client_data_hash)
+
+        # 2. Look up trusted metadata for this authenticator model
+        snapshot = self._snapshot
+        aaguid = attestation_object.auth_data.credential_data.aaguid
+        entry = snapshot.entries.get(aaguid)
+        if not result.trust_path:
+            # "none" or self attestation: nothing to check against the metadata, the policy decides. "unlisted"
+            # still requires a chain from listed models, so their attestation cannot be stripped to get through.
+            policy = Config.MDS_UNATTESTED_POLICY
+            if policy == "allow" or (policy == "unlisted" and entry is None):
+                return
+            raise UntrustedAttestation("Attestation has no certificate chain")
+        if entry is None:
+            raise UntrustedAttestation("Authenticator not found in metadata")
+        if entry.compromised_certificates.intersection(result.trust_path):
+            raise UntrustedAttestation("Attestation key compromised")
+
+        # 3. Validate the chain, reusing the result for certificates seen before
+        cache_key = (aaguid, hashlib.sha256(result.trust_path[0]).digest())
+        with snapshot.cache_lock:
+            trusted = snapshot.chain_cache.get(cache_key)
+            if trusted is not None:
+                snapshot.chain_cache.move_to_end(cache_key)
+
+        if trusted is None:
+            trusted = self._validate_chain(entry, result.trust_path)
+            with snapshot.cache_lock:
+                snapshot.chain_cache[cache_key] = trusted
+                if len(snapshot.chain_cache) > Config.ATTESTATION_CACHE_SIZE:
+                    snapshot.chain_cache.popitem(last=False)
+
+        if not trusted:
+            raise UntrustedAttestation("Attestation chain does not lead to a trusted root")
+
+    @staticmethod
+    def _validate_chain(entry: MetadataEntry, trust_path: list[bytes]) -> bool:
+        issuer = x509.load_der_x509_certificate(trust_path[-1]).issuer
+        for root in entry.roots:
+            if root.subject != issuer:
+                continue
+            try:
+                verify_x509_chain(trust_path + [root.der])
+                return True
+            except InvalidSignature:
+                continue
+        return False
+
+
+UNATTESTED_POLICIES = ("reject", "unlisted", "allow")
+
+
+def create_attestation_verifier() -> MetadataAttestationVerifier | None:
+    if not Config.MDS_BLOB_PATH:
+        return None
+    if Config.MDS_UNATTESTED_POLICY not in UNATTESTED_POLICIES:
+        raise RuntimeError(f"MDS_UNATTESTED_POLICY must be one of {', '.join(UNATTESTED_POLICIES)}")
+    if not Config.MDS_TRUST_ROOT_PATH:
+        # Without the trust root parse_blob() skips the blob signature check, so trust rests on an unsigned file
+        if not Config.MDS_ALLOW_UNSIGNED_BLOB:
+            raise RuntimeError("MDS_BLOB_PATH is set but MDS_TRUST_ROOT_PATH is not: refusing to trust an unverified "
+                               "metadata blob (set MDS_ALLOW_UNSIGNED_BLOB=true for local testing only)")
+        log_event("metadata_signature_unverified", level=logging.WARNING, path=Config.MDS_BLOB_PATH)
+    return MetadataAttestationVerifier(Config.MDS_BLOB_PATH, Config.MDS_TRUST_ROOT_PATH)
@@ -1,27 +1,35 @@
 import base64
+import logging
+import os
+import time
+from concurrent.futures import Future
+from typing import Callable
 
-from fido2.server import Fido2Server
-from fido2.webauthn import PublicKeyCredentialRpEntity, \
-    PublicKeyCredentialUserEntity, PublicKeyCredentialDescriptor, PublicKeyCredentialType
+from fido2.attestation.base import InvalidAttestation
+from fido2.utils import websafe_encode
+from fido2.webauthn import PublicKeyCredentialUserEntity, PublicKeyCredentialDescriptor, PublicKeyCredentialType
 
 from config import Config
 from exceptions import ExtensionValidationError
-from fido.store import store_credential, get_credentials_for_username, get_credential, update_sign_count
-from utils.encoding import b64url_decode
+from models import RegistrationCredential, AuthenticationCredential
+from fido.store import store_credential, get_credentials_for_username, get_credential, update_sign_count, \
+    mark_credential_used, get_allow_credentials
+from fido.sessions import check_session_audience, create_session, revoke_sessions
+from fido.tenants import get_server, get_relying_party, check_account_rp
 from utils.handle import get_user_handle
+from utils.log import log_event
+from utils.options import options_to_json
 from utils.jwt import decode_challenge_token, encode_challenge_token, validate_account_token
 
-rp_entity = PublicKeyCredentialRpEntity(id=Config.RP_ID, name=Config.RP_NAME)
-server = Fido2Server(rp_entity)
-
 
 # ---- Registration ----
-def start_registration(username: str) -> tuple[dict, str]:
+def start_registration(username: str, rp_id: str, challenge: bytes | None = None) -> tuple[dict, str]:
     """
-    Begins the WebAuthn registration ceremony for a given username.
+    Begins the WebAuthn registration ceremony for a given username at relying party `rp_id`.
+    `challenge` is the extension server's challenge in server-to-server mode, otherwise one is generated.
 
     Returns:
-        - publicKeyCredentialCreationOptions (dict)
+        - publicKeyCredentialCreationOptions (JSON-ready dict)
         - challenge_token (JWT-encoded state)
     """
     # 1. Generate user handle (should be stable across logins)
@@ -34,38 +42,64 @@ def start_registration(username: str) -> tuple[dict, str]:
         display_name=username
     )
 
-    # 3. Begin registration ceremony
-    options, state = server.register_begin(user=user,
-                                           credentials=[],
-                                           resident_key_requirement="preferred",
-                                           user_verification="discouraged",
-                                           authenticator_attachment="cross-platform")
+    # 3. Exclude already registered authenticators and enforce the per-user cap
+    rp = get_relying_party(rp_id)
+    existing = get_credentials_for_username(rp_id, username)
+    if len(existing) >= rp.max_credentials_per_user:
+        raise ValueError("Credential limit reached for user")
 
-    # 4. Embed state metadata into token (for stateless verification)
+    exclude_credentials = [
+        PublicKeyCredentialDescriptor(
+            id=cred["credential_id"],
+            type=PublicKeyCredentialType.PUBLIC_KEY
+        )
+        for cred in existing
+    ]
+
+    # 4. Begin registration ceremony
+    options, state = get_server(rp_id).register_begin(user=user,
+                                                      credentials=exclude_credentials,
+                                                      resident_key_requirement="preferred",
+                                                      user_verification="discouraged",
+                                                      authenticator_attachment="cross-platform",
+                                                      challenge=challenge)
+
+    # 5. Embed state metadata into token (for stateless verification)
     state["username"] = username
+    state["rp_id"] = rp_id
     state["user_handle"] = base64.urlsafe_b64encode(user_handle).decode("utf-8")
 
-    # 5. Return as tuple (options, challenge_token)
-    return dict(options), encode_challenge_token(state)
+    # 6. Return as tuple (publicKey options, challenge_token)
+    return options_to_json(options.public_key), encode_challenge_token(state)
 
 
-def finish_registration(attestation: dict, challenge_token: str, rp_account_token: str) -> bool:
+def finish_registration(attestation: RegistrationCredential, challenge_token: str, rp_account_token: str,
+                        extension_check: Callable[[str], Future] | None = None) -> bool:
     """
     Completes the WebAuthn registration process.
 
     Validates the signed challenge, attestation response, and account-level token.
+    When `extension_check` is given, the extension server validates the same response concurrently;
+    its outcome is awaited before anything is stored.
     Saves credential to in-memory store on success.
     """
+    started = time.perf_counter()
 
     # 1. Decode and validate challenge token (issued during /register/begin)
     state = decode_challenge_token(challenge_token)
     username = state.get("username")
+    rp_id = state.get("rp_id")
     user_handle_b64 = state.get("user_handle")
-    if not (username and user_handle_b64):
+    if not (username and rp_id and user_handle_b64):
         raise ValueError("Malformed challenge token")
+    rp = get_relying_party(rp_id)
+    extension_result = extension_check(username) if extension_check else None
 
-    # 2. Complete FIDO2/WebAuthn registration
-    auth_data = server.register_complete(state, attestation)
+    # 2. Complete FIDO2/WebAuthn registration (verifies attestation when metadata is configured)
+    try:
+        auth_data = get_server(rp_id).register_complete(state, attestation.to_fido2())
+    except InvalidAttestation as e:
+        raise ValueError(f"Attestation verification failed: {e}") from e
 
     # 3. Decode user handle from base64
     try:
@@ -77,70 +111,86 @@ def finish_registration(attestation: dict, challenge_token: str, rp_account_toke
     claims = validate_account_token(rp_account_token)
     if claims.get(Config.USER_KEY) != username:
         raise ValueError("Account token does not match user")
+    check_account_rp(rp_id, claims.get(Config.ACCOUNT_ID_KEY))
 
     # 5. Inspect standard extension `credProps` (optional)
-    cred_props = attestation.get('extensions', {}).get('credProps') if attestation.get('extensions') else {}
-    if cred_props:
-        print(f"credProps from authenticator: {cred_props}")
-    else:
-        print("No credProps extension found in authenticator response")
+    cred_props = attestation.extensions.get("credProps") or {}
 
-    # 6. Store credential in in-memory DB
+    # 6. Wait for server-to-server extension validation
+    if extension_result is not None:
+        extension_result.result()
+
+    # 7. Store credential in in-memory DB (rejects duplicate IDs and re-checks the cap atomically,
+    #    since concurrent ceremonies may have registered meanwhile)
     store_credential(
         credential_id=auth_data.credential_data.credential_id,
         user_handle=user_handle,
         public_key=auth_data.credential_data.public_key,
         sign_count=0,
         username=username,
-        rp_id=Config.RP_ID,
+        rp_id=rp_id,
         credential_data=auth_data.credential_data,
         is_resident_key=cred_props.get("rk", False),
+        max_credentials=rp.max_credentials_per_user,
     )
 
-    print("✅ REGISTRATION SUCCESS for", username)
+    log_event("registration_success", sampled=True, username=username, cred_props=cred_props or None,
+              duration_ms=round((time.perf_counter() - started) * 1000, 2))
     return True
 
 
 # ---- Authentication ----
-def start_authentication(username: str):
-    # 1. Load registered credentials for this user
-    credentials = get_credentials_for_username(username)
-    if not credentials:
+def start_authentication(username: str, rp_id: str, challenge: bytes | None = None):
+    # 1. Load the pre-encoded allowCredentials list for this user at this relying party
+    allow_credentials = get_allow_credentials(rp_id, username)
+    if not allow_credentials:
         raise ValueError("User not found or no credentials registered")
 
-    # 2. Prepare allowCredentials list
-    allow_credentials = [
-        PublicKeyCredentialDescriptor(
-            id=cred["credential_id"],
-            type=PublicKeyCredentialType.PUBLIC_KEY
-        )
-        for cred in credentials
-    ]
-
-    # 3. Begin authentication ceremony
-    options, state = server.authenticate_begin(allow_credentials)
-    state["username"] = username  # Required later during verification
-
-    # 4. Return publicKey options + JWT-encoded state
-    return dict(options), encode_challenge_token(state)
-
-
-def finish_authentication(assertion: dict, challenge_token: str, rp_access_token: str) -> bool:
+    # 2. Begin authentication ceremony: only the challenge is fresh, the rest is reused as-is.
+    #    Mirrors Fido2Server.authenticate_begin (same options and internal state layout).
+    challenge = websafe_encode(challenge or os.urandom(32))
+    state = {
+        "challenge": challenge,
+        "user_verification": None,
+        "username": username,  # Required later during verification
+        "rp_id": rp_id,
+    }
+    public_key = {
+        "challenge": challenge,
+        "rpId": get_relying_party(rp_id).id,
+        "allowCredentials": allow_credentials,
+    }
+
+    # 3. Return publicKey options + JWT-encoded state
+    return public_key, encode_challenge_token(state)
+
+
+def finish_authentication(assertion: AuthenticationCredential, challenge_token: str, rp_access_token: str,
+                          extension_check: Callable[[str], Future] | None = None,
+                          session_audience: str | None = None) -> str | None:
     """
     Completes the WebAuthn authentication ceremony.
 
-    :param assertion: WebAuthn assertion from the browser
+    :param assertion: WebAuthn assertion from the browser, already decoded and size-checked
     :param challenge_token: Encoded JWT state from /authenticate/begin
     :param rp_access_token: JWT issued by IdP (aud: rp-server)
-    :return: True if successful, raises on failure
+    :param extension_check: Starts server-to-server extension validation, run concurrently with verification
+    :param session_audience: When given, a resumable session is issued for this audience
+    :return: The session token if one was requested, otherwise None; raises on failure
     """
+    started = time.perf_counter()
+    if session_audience is not None:
+        check_session_audience(session_audience)
+
     # 1. Decode challenge token and extract session state
     state = decode_challenge_token(challenge_token)
     username = state["username"]
+    rp_id = state["rp_id"]
+    extension_result = extension_check(username) if extension_check else None
 
     # 2. Lookup credential in server-side store
-    credential_id = b64url_decode(assertion["rawId"])
-    stored = get_credential(credential_id)
+    credential_id = assertion.rawId
+    stored = get_credential(rp_id, credential_id)
     if not stored:
         raise ValueError("Credential not found for ID")
 
@@ -148,21 +198,40 @@ def finish_authentication(assertion: dict, challenge_token: str, rp_access_token
     claims = validate_account_token(rp_access_token)
     if claims.get(Config.USER_KEY) != username:
         raise ValueError("Account token does not match user")
+    check_account_rp(rp_id, claims.get(Config.ACCOUNT_ID_KEY))
 
     # 4. Match account_id if your system is multi-tenant
     if "account_id" in stored and claims.get(Config.ACCOUNT_ID_KEY) != stored["account_id"]:
         raise ExtensionValidationError("Account ID mismatch")
 
     # 5. Complete authentication ceremony (validates signature, challenge, origin)
-    auth_data = server.authenticate_complete(
+    get_server(rp_id).authenticate_complete(
         state,  # from JWT
         [stored["credential_data"]],
-        assertion  # raw browser response (WebAuthn assertion)
+        assertion.to_fido2()  # decoded browser response (WebAuthn assertion)
     )
 
-    # 6. Update stored signature counter (prevents cloned credential replay)
-    if hasattr(auth_data, "new_sign_count"):
-        update_sign_count(credential_id, auth_data.new_sign_count)
-
-    print("✅ AUTHENTICATION SUCCESS for", username)
-    return True
+    # 6. Reject counter regressions (possible cloned authenticator) and drop any sessions it resumed
+    sign_count = assertion.response.authenticatorData.counter
+    if stored["sign_count"] and sign_count <= stored["sign_count"]:
+        revoked = revoke_sessions(rp_id, credential_id)
+        log_event("sign_count_regression", level=logging.WARNING, username=username,
+                  stored=stored["sign_count"], received=sign_count, revoked_sessions=revoked)
+        raise ValueError("Signature counter regression")
+
+    # 7. Wait for server-to-server extension validation
+    if extension_result is not None:
+        extension_result.result()
+
+    # 8. Update stored signature counter (prevents cloned credential replay)
+    update_sign_count(rp_id, credential_id, sign_count)
+    mark_credential_used(rp_id, credential_id)
+
+    # 9. Issue a resumable session bound to the audience, credential and sign count (optional)
+    session_token = None
+    if session_audience is not None:
+        session_token = create_session(rp_id, username, credential_id, sign_count, session_audience)
+
+    log_event("authentication_success", sampled=True, username=username, session=session_token is not None,
+              duration_ms=round((time.perf_counter() - started) * 1000, 2))
+    return session_token
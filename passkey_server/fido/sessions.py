@@ -0,0 +1,106 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple
+
+from config import Config
+from fido.store import get_credential
+
+
+class Session(NamedTuple):
+    rp_id: str
+    username: str
+    credential_id: bytes
+    sign_count: int
+    audience: str
+    expires_at: float
+
+
+# Expiring session cache: token -> Session. All sessions share one TTL, so insertion order is expiry order.
+SESSION_CACHE: OrderedDict[str, Session] = OrderedDict()
+
+# Secondary index: (rp_id, credential_id) -> tokens, used to revoke every session of a credential at once
+CREDENTIAL_SESSIONS: Dict[tuple[str, bytes], set[str]] = {}
+
+_session_lock = threading.Lock()
+
+
+def _remove_locked(token: str) -> None:
+    session = SESSION_CACHE.pop(token, None)
+    if session is None:
+        return
+    key = (session.rp_id, session.credential_id)
+    tokens = CREDENTIAL_SESSIONS.get(key)
+    if tokens is not None:
+        tokens.discard(token)
+        if not tokens:
+            del CREDENTIAL_SESSIONS[key]
+
+
+def _prune_locked(now: float) -> None:
+    while SESSION_CACHE:
+        token, session = next(iter(SESSION_CACHE.items()))
+        if session.expires_at > now and len(SESSION_CACHE) <= Config.SESSION_CACHE_SIZE:
+            break
+        _remove_locked(token)
+
+
+def check_session_audience(audience: str) -> None:
+    if not Config.SESSION_AUDIENCES:
+        raise ValueError("Session resumption is disabled")
+    if audience not in Config.SESSION_AUDIENCES:
+        raise ValueError("Unknown session audience")
+
+
+def create_session(rp_id: str, username: str, credential_id: bytes, sign_count: int, audience: str) -> str:
+    """
+    Issues an opaque session token bound to `audience`, the credential and the sign count it was issued at.
+    """
+    check_session_audience(audience)
+    token = secrets.token_urlsafe(32)
+    now = time.time()
+    with _session_lock:
+        SESSION_CACHE[token] = Session(rp_id, username, credential_id, sign_count, audience,
+                                       now + Config.SESSION_TTL_SECONDS)
+        CREDENTIAL_SESSIONS.setdefault((rp_id, credential_id), set()).add(token)
+        _prune_locked(now)
+    return token
+
+
+def verify_session(token: str, audience: str, rp_id: str) -> Session:
+    """
+    Validates a session token without a WebAuthn ceremony.
+
+    The session is rejected once expired, when presented for another audience or relying party,
+    when its credential is no longer stored (revoked or compacted) or when the stored sign count
+    has fallen below the one the session was issued at.
+    """
+    session = SESSION_CACHE.get(token)
+    if session is None or session.expires_at <= time.time():
+        raise ValueError("Invalid or expired session")
+    if session.audience != audience or session.rp_id != rp_id:
+        raise ValueError("Invalid or expired session")
+
+    stored = get_credential(session.rp_id, session.credential_id)
+    if stored is None or stored["sign_count"] < session.sign_count:
+        revoke_sessions(session.rp_id, session.credential_id)
+        raise ValueError("Invalid or expired session")
+    return session
+
+
+def revoke_sessions(rp_id: str, credential_id: bytes) -> int:
+    """Drops every session issued for a credential, returning how many were removed."""
+    with _session_lock:
+        tokens = CREDENTIAL_SESSIONS.pop((rp_id, credential_id), set())
+        for token in tokens:
+            SESSION_CACHE.pop(token, None)
+    return len(tokens)
+
+
+def prune_expired_sessions() -> int:
+    """Drops expired sessions even when no new ones are being issued."""
+    with _session_lock:
+        before = len(SESSION_CACHE)
+        _prune_locked(time.time())
+        return before - len(SESSION_CACHE)
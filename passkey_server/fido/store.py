@@ -1,7 +1,24 @@
+import threading
+import time
+from collections import OrderedDict
 from typing import Dict, Any
 
-# Global in-memory credential store
-CREDENTIAL_STORE: Dict[bytes, Dict[str, Any]] = {}
+from fido2.utils import websafe_encode
+from fido2.webauthn import PublicKeyCredentialType
+
+from config import Config
+
+# Global in-memory credential store, partitioned by RP ID: rp_id -> credential_id -> record
+CREDENTIAL_STORE: Dict[str, Dict[bytes, Dict[str, Any]]] = {}
+
+# Secondary index, partitioned by RP ID: rp_id -> username -> credential IDs (dict keeps registration order)
+USERNAME_INDEX: Dict[str, Dict[str, Dict[bytes, None]]] = {}
+
+# LRU of pre-encoded allowCredentials lists: (rp_id, username) -> [{"type": ..., "id": ...}]
+ALLOW_CREDENTIALS_CACHE: OrderedDict[tuple[str, str], list[Dict[str, str]]] = OrderedDict()
+
+# Guards writes that touch the store, the index or the allowCredentials cache
+_store_lock = threading.Lock()
 
 
 def store_credential(
@@ -12,32 +29,151 @@ def store_credential(
         username: str,
         rp_id: str,
         credential_data: Any,
-        is_resident_key: bool = False
+        is_resident_key: bool = False,
+        max_credentials: int | None = None
 ) -> None:
-    CREDENTIAL_STORE[credential_id] = {
-        "credential_id": credential_id,
-        "user_handle": user_handle,
-        "public_key": public_key,
-        "sign_count": sign_count,
-        "username": username,
-        "rp_id": rp_id,
-        "credential_data": credential_data,
-        "is_resident_key": is_resident_key
-    }
+    """
+    Stores a new credential. Duplicate credential IDs and the per-user cap are checked under the same
+    lock as the insert, so concurrent registrations cannot slip past either check.
+    """
+    now = time.time()
+    with _store_lock:
+        credentials = CREDENTIAL_STORE.setdefault(rp_id, {})
+        if credential_id in credentials:
+            raise ValueError("Credential already registered")
+        user_credentials = USERNAME_INDEX.get(rp_id, {}).get(username, {})
+        if max_credentials is not None and len(user_credentials) >= max_credentials:
+            raise ValueError("Credential limit reached for user")
+
+        credentials[credential_id] = {
+            "credential_id": credential_id,
+            "user_handle": user_handle,
+            "public_key": public_key,
+            "sign_count": sign_count,
+            "username": username,
+            "rp_id": rp_id,
+            "credential_data": credential_data,
+            "is_resident_key": is_resident_key,
+            "created_at": now,
+            "last_used_at": now,
+        }
+        USERNAME_INDEX.setdefault(rp_id, {}).setdefault(username, {})[credential_id] = None
+        ALLOW_CREDENTIALS_CACHE.pop((rp_id, username), None)
+
+
+def get_credential(rp_id: str, credential_id: bytes) -> Dict[str, Any] | None:
+    return CREDENTIAL_STORE.get(rp_id, {}).get(credential_id)
+
+
+def get_credentials_for_user(rp_id: str, user_handle: bytes) -> list[Dict[str, Any]]:
+    return [cred for cred in CREDENTIAL_STORE.get(rp_id, {}).values() if cred["user_handle"] == user_handle]
+
+
+def get_credentials_for_username(rp_id: str, username: str) -> list[Dict[str, Any]]:
+    credentials = CREDENTIAL_STORE.get(rp_id, {})
+    credential_ids = USERNAME_INDEX.get(rp_id, {}).get(username, {})
+    return [credentials[cid] for cid in list(credential_ids) if cid in credentials]
 
 
-def get_credential(credential_id: bytes) -> Dict[str, Any] | None:
-    return CREDENTIAL_STORE.get(credential_id)
+def get_allow_credentials(rp_id: str, username: str) -> list[Dict[str, str]]:
+    """
+    Returns the user's allowCredentials descriptors, already encoded for JSON.
+    Cached per user and invalidated whenever one of their credentials is stored or removed.
+    The returned list is shared and must not be mutated.
+    """
+    key = (rp_id, username)
+    with _store_lock:
+        allow_credentials = ALLOW_CREDENTIALS_CACHE.get(key)
+        if allow_credentials is not None:
+            ALLOW_CREDENTIALS_CACHE.move_to_end(key)
+            return allow_credentials
 
+        allow_credentials = [
+            {"type": PublicKeyCredentialType.PUBLIC_KEY.value, "id": websafe_encode(cid)}
+            for cid in USERNAME_INDEX.get(rp_id, {}).get(username, {})
+        ]
+        if allow_credentials:
+            ALLOW_CREDENTIALS_CACHE[key] = allow_credentials
+            if len(ALLOW_CREDENTIALS_CACHE) > Config.ALLOW_CREDENTIALS_CACHE_SIZE:
+                ALLOW_CREDENTIALS_CACHE.popitem(last=False)
+        return allow_credentials
 
-def get_credentials_for_user(user_handle: bytes) -> list[Dict[str, Any]]:
-    return [cred for cred in CREDENTIAL_STORE.values() if cred["user_handle"] == user_handle]
 
+def _remove_locked(rp_id: str, credential_id: bytes) -> None:
+    cred = CREDENTIAL_STORE[rp_id].pop(credential_id)
+    users = USERNAME_INDEX.get(rp_id, {})
+    credential_ids = users.get(cred["username"])
+    ALLOW_CREDENTIALS_CACHE.pop((rp_id, cred["username"]), None)
+    if credential_ids is not None:
+        credential_ids.pop(credential_id, None)
+        if not credential_ids:
+            del users[cred["username"]]
 
-def get_credentials_for_username(username: str) -> list[Dict[str, Any]]:
-    return [cred for cred in CREDENTIAL_STORE.values() if cred["username"] == username]
 
+def remove_credential(rp_id: str, credential_id: bytes) -> bool:
+    with _store_lock:
+        if credential_id not in CREDENTIAL_STORE.get(rp_id, {}):
+            return False
+        _remove_locked(rp_id, credential_id)
+        return True
 
-def update_sign_count(credential_id: bytes, new_sign_count: int) -> None:
-    if credential_id in CREDENTIAL_STORE:
-        CREDENTIAL_STORE[credential_id]["sign_count"] = new_sign_count
+
+def update_sign_count(rp_id: str, credential_id: bytes, new_sign_count: int) -> None:
+    cred = get_credential(rp_id, credential_id)
+    if cred is not None:
+        cred["sign_count"] = new_sign_count
+
+
+def mark_credential_used(rp_id: str, credential_id: bytes) -> None:
+    cred = get_credential(rp_id, credential_id)
+    if cred is not None:
+        cred["last_used_at"] = time.time()
+
+
+def get_allow_list_stats() -> Dict[str, Any]:
+    """
+    Summarises allowCredentials sizes, i.e. the number of credentials per user, across all RPs.
+    """
+    sizes = [
+        len(credential_ids)
+        for users in list(USERNAME_INDEX.values())
+        for credential_ids in list(users.values())
+    ]
+    return {
+        "relying_parties": len(USERNAME_INDEX),
+        "users": len(sizes),
+        "credentials": sum(sizes),
+        "max_allow_list": max(sizes, default=0),
+        "mean_allow_list": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+    }
+
+
+def compact_credentials(max_idle_seconds: int) -> Dict[str, Any]:
+    """
+    Evicts credentials not used within `max_idle_seconds`.
+
+    Returns allow-list stats before and after the pass, plus the eviction count.
+    """
+    before = get_allow_list_stats()
+    cutoff = time.time() - max_idle_seconds
+
+    stale = [
+        (rp_id, cid)
+        for rp_id, credentials in list(CREDENTIAL_STORE.items())
+        for cid, cred in list(credentials.items())
+        if cred["last_used_at"] < cutoff
+    ]
+    evicted = 0
+    for rp_id, cid in stale:
+        with _store_lock:
+            # Re-check under the lock: the credential may have been used since the scan
+            cred = CREDENTIAL_STORE[rp_id].get(cid)
+            if cred is not None and cred["last_used_at"] < cutoff:
+                _remove_locked(rp_id, cid)
+                evicted += 1
+
+    return {
+        "evicted": evicted,
+        "before": before,
+        "after": get_allow_list_stats(),
+    }
@@ -0,0 +1,102 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from fido2.server import Fido2Server
+from fido2.webauthn import PublicKeyCredentialRpEntity
+
+from config import Config
+from fido.metadata import create_attestation_verifier
+
+
+class RelyingParty(NamedTuple):
+    id: str
+    name: str
+    hosts: tuple[str, ...]
+    accounts: tuple[str, ...]
+    max_credentials_per_user: int
+
+
+def _load_relying_parties() -> dict[str, RelyingParty]:
+    """
+    Reads tenants from RP_TENANTS (JSON list), falling back to the single RP_ID/RP_NAME relying party.
+    """
+    tenants = json.loads(Config.RP_TENANTS) if Config.RP_TENANTS else [{"id": Config.RP_ID, "name": Config.RP_NAME}]
+    relying_parties = {}
+    for tenant in tenants:
+        rp = RelyingParty(
+            id=tenant["id"],
+            name=tenant.get("name", tenant["id"]),
+            hosts=tuple(host.lower() for host in tenant.get("hosts", [tenant["id"]])),
+            accounts=tuple(tenant.get("accounts", [])),
+            max_credentials_per_user=tenant.get("max_credentials_per_user", Config.MAX_CREDENTIALS_PER_USER),
+        )
+        relying_parties[rp.id] = rp
+    return relying_parties
+
+
+RELYING_PARTIES = _load_relying_parties()
+HOST_INDEX = {host: rp.id for rp in RELYING_PARTIES.values() for host in rp.hosts}
+ACCOUNT_INDEX = {account: rp.id for rp in RELYING_PARTIES.values() for account in rp.accounts}
+
+# Shared by every tenant: metadata is keyed by authenticator model, not by RP
+attestation_verifier = create_attestation_verifier()
+
+# LRU of constructed servers: rp_id -> Fido2Server
+_servers: OrderedDict[str, Fido2Server] = OrderedDict()
+_servers_lock = threading.Lock()
+
+
+def resolve_rp_id(host: str | None = None) -> str:
+    """
+    Resolves the relying party for a request from its Host header.
+    Account tokens are checked against the resolved RP when the ceremony completes (see check_account_rp).
+    """
+    if host:
+        hostname = host.split(":", 1)[0].lower()
+        if hostname in HOST_INDEX:
+            return HOST_INDEX[hostname]
+
+    if len(RELYING_PARTIES) == 1:
+        return next(iter(RELYING_PARTIES))
+
+    raise ValueError("Unknown relying party")
+
+
+def check_account_rp(rp_id: str, account_id: str | None) -> None:
+    """
+    Rejects account tokens whose account_id is bound to a different relying party.
+    """
+    if account_id in ACCOUNT_INDEX and ACCOUNT_INDEX[account_id] != rp_id:
+        raise ValueError("Account does not belong to this relying party")
+
+
+def get_relying_party(rp_id: str) -> RelyingParty:
+    rp = RELYING_PARTIES.get(rp_id)
+    if rp is None:
+        raise ValueError("Unknown relying party")
+    return rp
+
+
+def get_server(rp_id: str) -> Fido2Server:
+    with _servers_lock:
+        server = _servers.get(rp_id)
+        if server is not None:
+            _servers.move_to_end(rp_id)
+            return server
+
+    rp = get_relying_party(rp_id)
+    server = Fido2Server(PublicKeyCredentialRpEntity(id=rp.id, name=rp.name),
+                         attestation="direct" if attestation_verifier else None,
+                         verify_attestation=attestation_verifier)
+
+    with _servers_lock:
+        server = _servers.setdefault(rp_id, server)
+        if len(_servers) > Config.RP_SERVER_CACHE_SIZE:
+            _servers.popitem(last=False)
+    return server
+
+
+def server_cache_size() -> int:
+    return len(_servers)
@@ -1,8 +1,14 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
 import uvicorn
-from fastapi import FastAPI, Depends, Header, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fido2.utils import websafe_encode
 
 from config import Config
 from exceptions.handlers import register_exception_handlers
@@ -12,12 +18,55 @@ from fido.service import (
     start_authentication,
     finish_authentication,
 )
+from fido.extensions import create_extension_client
+from fido.maintenance import run_credential_compaction, run_metadata_reload, run_session_prune
+from fido.sessions import SESSION_CACHE, verify_session
+from fido.store import ALLOW_CREDENTIALS_CACHE, get_allow_list_stats
+from fido.tenants import attestation_verifier, resolve_rp_id, server_cache_size
+from middleware.admission import AdmissionControlMiddleware
+from middleware.profiler import ProfileRequestMiddleware, profile_for, verify_admin_token
 from models import BeginResponse, CompleteResponse
 from models import RegisterBeginRequest, RegisterCompleteRequest, AuthBeginRequest, AuthCompleteRequest
-
-app = FastAPI()
+from models import SessionVerifyRequest, SessionVerifyResponse
+from utils.log import dropped_log_records
+from utils.memory import memory_tracker
+from utils.responses import OrjsonResponse
+
+# Server-to-server extension validation, enabled by EXTENSION_SERVER_URL
+extension_client = create_extension_client()
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    tasks = [asyncio.create_task(run_credential_compaction())]
+    if attestation_verifier:
+        tasks.append(asyncio.create_task(run_metadata_reload(attestation_verifier)))
+    if Config.SESSION_AUDIENCES:
+        tasks.append(asyncio.create_task(run_session_prune()))
+    if extension_client:
+        extension_client.open()
+    yield
+    for task in tasks:
+        task.cancel()
+    if extension_client:
+        await extension_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=OrjsonResponse)
 register_exception_handlers(app)
 
+# Innermost, so a profiled request samples the handler itself; nothing is installed without an admin token
+if Config.PROFILER_ADMIN_TOKEN:
+    app.add_middleware(ProfileRequestMiddleware)
+
+# Added before CORS so that 429/503 rejections still carry CORS headers
+app.add_middleware(
+    AdmissionControlMiddleware,
+    limited_paths=("/register/begin", "/register/complete", "/authenticate/begin", "/authenticate/complete"),
+    username_paths=("/register/begin", "/authenticate/begin"),
+    exempt_paths=("/debug/profile", "/metrics/memory"),
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=Config.ALLOWED_ORIGINS,
@@ -39,34 +88,106 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     return credentials.credentials
 
 
+# Dependency to read the extension token forwarded to the extension server (server-to-server mode only)
+def extension_token(x_extension_token: str | None = Header(default=None)) -> str | None:
+    if extension_client is None:
+        return None
+    if not x_extension_token:
+        raise HTTPException(status_code=401, detail="Missing X-Extension-Token header")
+    return x_extension_token
+
+
+def extension_check(token: str | None, client_data: bytes):
+    if token is None:
+        return None
+    return extension_client.start_validation(token, websafe_encode(client_data))
+
+
 @app.post("/register/begin", response_model=BeginResponse)
-def register_options(payload: RegisterBeginRequest):
-    public_key, challenge_token = start_registration(payload.username)
-    return JSONResponse(content={
-        "publicKey": public_key['publicKey'],
+async def register_options(payload: RegisterBeginRequest, request: Request,
+                           extn_token: str | None = Depends(extension_token)):
+    rp_id = resolve_rp_id(host=request.headers.get("host"))
+    challenge = await extension_client.prepare(payload.username, extn_token) if extn_token else None
+    public_key, challenge_token = await run_in_threadpool(start_registration, payload.username, rp_id, challenge)
+    return OrjsonResponse(content={
+        "publicKey": public_key,
         "challenge_token": challenge_token,
     })
 
 
 @app.post("/register/complete", response_model=CompleteResponse)
-def register_verify(payload: RegisterCompleteRequest, rp_account_token: str = Depends(verify_token)):
-    finish_registration(payload.attestation, payload.challenge_token, rp_account_token)
-    return {"status": "OK"}
+async def register_verify(payload: RegisterCompleteRequest, rp_account_token: str = Depends(verify_token),
+                          extn_token: str | None = Depends(extension_token)):
+    await run_in_threadpool(finish_registration, payload.attestation, payload.challenge_token, rp_account_token,
+                            extension_check(extn_token, payload.attestation.response.clientDataJSON))
+    return OrjsonResponse(content={"status": "OK"})
 
 
 @app.post("/authenticate/begin", response_model=BeginResponse)
-def authenticate_begin(payload: AuthBeginRequest):
-    public_key, challenge_token = start_authentication(payload.username)
-    return JSONResponse(content={
-        "publicKey": public_key['publicKey'],
+async def authenticate_begin(payload: AuthBeginRequest, request: Request,
+                             extn_token: str | None = Depends(extension_token)):
+    rp_id = resolve_rp_id(host=request.headers.get("host"))
+    challenge = await extension_client.prepare(payload.username, extn_token) if extn_token else None
+    public_key, challenge_token = await run_in_threadpool(start_authentication, payload.username, rp_id, challenge)
+    return OrjsonResponse(content={
+        "publicKey": public_key,
         "challenge_token": challenge_token,
     })
 
 
 @app.post("/authenticate/complete", response_model=CompleteResponse)
-def authenticate_complete(payload: AuthCompleteRequest, rp_account_token: str = Depends(verify_token)):
-    finish_authentication(payload.assertion, payload.challenge_token, rp_account_token)
-    return JSONResponse(content={"status": "OK"})
+async def authenticate_complete(payload: AuthCompleteRequest, rp_account_token: str = Depends(verify_token),
+                                extn_token: str | None = Depends(extension_token)):
+    session_token = await run_in_threadpool(finish_authentication, payload.assertion, payload.challenge_token,
+                                            rp_account_token,
+                                            extension_check(extn_token, payload.assertion.response.clientDataJSON),
+                                            payload.session_audience)
+    if session_token is None:
+        return OrjsonResponse(content={"status": "OK"})
+    return OrjsonResponse(content={
+        "status": "OK",
+        "session_token": session_token,
+        "session_expires_in": Config.SESSION_TTL_SECONDS,
+    })
+
+
+@app.post("/session/verify", response_model=SessionVerifyResponse)
+async def session_verify(payload: SessionVerifyRequest, request: Request):
+    # Dictionary lookups only: cheap enough to run on the event loop
+    rp_id = resolve_rp_id(host=request.headers.get("host"))
+    try:
+        session = verify_session(payload.session_token, payload.audience, rp_id)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    return OrjsonResponse(content={
+        "status": "OK",
+        Config.USER_KEY: session.username,
+        "expires_in": max(0, int(session.expires_at - time.time())),
+    })
+
+
+@app.get("/metrics/memory", dependencies=[Depends(verify_admin_token)])
+async def memory():
+    allow_list_stats = get_allow_list_stats()
+    structures = {
+        "credentials": allow_list_stats["credentials"],
+        "users": allow_list_stats["users"],
+        "allow_credentials_cache": len(ALLOW_CREDENTIALS_CACHE),
+        "sessions": len(SESSION_CACHE),
+        "fido2_servers": server_cache_size(),
+    }
+    # tracemalloc snapshots can take a while with many live allocations
+    report = await run_in_threadpool(memory_tracker.report, structures)
+    report["dropped_log_records"] = dropped_log_records()
+    return report
+
+
+if Config.PROFILER_ADMIN_TOKEN:
+    @app.get("/debug/profile", response_class=PlainTextResponse, include_in_schema=False,
+             dependencies=[Depends(verify_admin_token)])
+    async def profile(seconds: float = Query(default=10, gt=0, le=Config.PROFILER_MAX_SECONDS)):
+        # Samples the whole process for `seconds` and returns collapsed stacks
+        return PlainTextResponse(await profile_for(seconds))
 
 
 if __name__ == "__main__":
@@ -1,4 +1,125 @@
-from pydantic import BaseModel
+from typing import Annotated, Literal
+
+from fido2.utils import websafe_encode
+from fido2.webauthn import (
+    AttestationObject, AuthenticatorData, CollectedClientData, RegistrationResponse, AuthenticationResponse,
+    AuthenticatorAttestationResponse, AuthenticatorAssertionResponse,
+)
+from pydantic import BaseModel, BeforeValidator, ConfigDict, model_validator
+
+from config import Config
+from utils.encoding import b64url_decode
+
+
+def _decoder(max_bytes: int, parse=None):
+    """
+    Builds a validator that base64url-decodes a field exactly once, enforces its size limit
+    (checked on the encoded length first, so oversized input is never decoded) and optionally
+    parses the bytes into a fido2 object.
+    """
+
+    def decode(value):
+        if not isinstance(value, str):
+            raise ValueError("must be a base64url string")
+        if len(value) > (max_bytes * 4 + 2) // 3:
+            raise ValueError(f"exceeds {max_bytes} bytes")
+        try:
+            raw = b64url_decode(value)
+            return parse(raw) if parse else raw
+        except Exception as e:
+            # fido2's parsers surface truncated input as IndexError, struct.error, KeyError, ...
+            raise ValueError("malformed value") from e
+
+    return BeforeValidator(decode)
+
+
+# COSE curve -> coordinate length in bytes (RFC 9053): EC2 x/y and OKP x are fixed-length byte strings
+_COORDINATE_BYTES = {1: 32, 2: 48, 3: 66, 6: 32, 7: 57, 8: 32}
+
+
+def _parse_attestation_object(raw: bytes) -> AttestationObject:
+    """
+    fido2's CBOR decoder does not check byte string lengths, so a truncated attestation object still
+    parses, with a shortened public key coordinate that only fails once the credential is used.
+    """
+    attestation_object = AttestationObject(raw)
+    credential_data = attestation_object.auth_data.credential_data
+    if credential_data is not None:
+        public_key = credential_data.public_key
+        size = _COORDINATE_BYTES.get(public_key.get(-1))
+        labels = (-2, -3) if public_key.get(1) == 2 else (-2,)  # EC2 keys have x and y, OKP keys only x
+        if size is not None and any(len(public_key.get(label, b"")) != size for label in labels):
+            raise ValueError("truncated public key")
+    return attestation_object
+
+
+CredentialId = Annotated[bytes, _decoder(Config.MAX_CREDENTIAL_ID_BYTES)]
+ClientDataJSON = Annotated[CollectedClientData, _decoder(Config.MAX_CLIENT_DATA_BYTES, CollectedClientData)]
+AttestationObjectBytes = Annotated[AttestationObject,
+                                   _decoder(Config.MAX_ATTESTATION_OBJECT_BYTES, _parse_attestation_object)]
+AuthenticatorDataBytes = Annotated[AuthenticatorData, _decoder(Config.MAX_AUTHENTICATOR_DATA_BYTES, AuthenticatorData)]
+Signature = Annotated[bytes, _decoder(Config.MAX_SIGNATURE_BYTES)]
+UserHandle = Annotated[bytes, _decoder(Config.MAX_USER_HANDLE_BYTES)]
+
+
+class _Credential(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    id: str
+    rawId: CredentialId
+    type: Literal["public-key"]
+
+    @model_validator(mode="after")
+    def check_id_matches_raw_id(self):
+        if self.id != websafe_encode(self.rawId):
+            raise ValueError("id does not match rawId")
+        return self
+
+
+class AttestationResponse(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    clientDataJSON: ClientDataJSON
+    attestationObject: AttestationObjectBytes
+
+
+class RegistrationCredential(_Credential):
+    response: AttestationResponse
+    extensions: dict = {}  # getClientExtensionResults()
+
+    def to_fido2(self) -> RegistrationResponse:
+        return RegistrationResponse(
+            raw_id=self.rawId,
+            response=AuthenticatorAttestationResponse(
+                client_data=self.response.clientDataJSON,
+                attestation_object=self.response.attestationObject,
+            ),
+        )
+
+
+class AssertionResponse(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    clientDataJSON: ClientDataJSON
+    authenticatorData: AuthenticatorDataBytes
+    signature: Signature
+    userHandle: UserHandle | None = None
+    clientExtensionResults: dict = {}
+
+
+class AuthenticationCredential(_Credential):
+    response: AssertionResponse
+
+    def to_fido2(self) -> AuthenticationResponse:
+        return AuthenticationResponse(
+            raw_id=self.rawId,
+            response=AuthenticatorAssertionResponse(
+                client_data=self.response.clientDataJSON,
+                authenticator_data=self.response.authenticatorData,
+                signature=self.response.signature,
+                user_handle=self.response.userHandle,
+            ),
+        )
 
 
 class RegisterBeginRequest(BaseModel):
@@ -6,7 +127,7 @@ class RegisterBeginRequest(BaseModel):
 
 
 class RegisterCompleteRequest(BaseModel):
-    attestation: dict
+    attestation: RegistrationCredential
     challenge_token: str
 
 
@@ -15,8 +136,14 @@ class AuthBeginRequest(BaseModel):
 
 
 class AuthCompleteRequest(BaseModel):
-    assertion: dict
+    assertion: AuthenticationCredential
     challenge_token: str
+    session_audience: str | None = None  # Request a resumable session for this audience
+
+
+class SessionVerifyRequest(BaseModel):
+    session_token: str
+    audience: str
 
 
 class BeginResponse(BaseModel):
@@ -26,3 +153,11 @@ class BeginResponse(BaseModel):
 
 class CompleteResponse(BaseModel):
     status: str
+    session_token: str | None = None
+    session_expires_in: int | None = None
+
+
+class SessionVerifyResponse(BaseModel):
+    status: str
+    user: str
+    expires_in: int
@@ -0,0 +1,7 @@
+import os
+
+# Read by config at import time: the tests run many ceremonies from one client, and session resumption
+# is disabled unless an audience is listed
+os.environ.setdefault("RATE_LIMIT_IP_BURST", "1000")
+os.environ.setdefault("RATE_LIMIT_USER_BURST", "1000")
+os.environ.setdefault("SESSION_AUDIENCES", "app,admin")
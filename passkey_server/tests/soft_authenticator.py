@@ -0,0 +1,56 @@
+"""
+Test helpers: IdP-style account tokens and a software authenticator that drives WebAuthn ceremonies.
+"""
+import hashlib
+import json
+import os
+import struct
+import time
+
+import jwt
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from fido2 import cbor
+from fido2.cose import ES256
+from fido2.utils import websafe_encode
+
+from config import Config
+
+
+def account_token(user: str, audience: str = Config.JWT_AUDIENCE) -> str:
+    now = int(time.time())
+    return jwt.encode({Config.USER_KEY: user, Config.ACCOUNT_ID_KEY: "acc001", "iss": Config.JWT_ORIGINAL_ISSUER,
+                       "aud": audience, "iat": now, "exp": now + 60}, Config.JWT_SECRET, algorithm=Config.JWT_ALGORITHM)
+
+
+def client_data(challenge: str, ceremony: str = "webauthn.create") -> bytes:
+    return json.dumps({"type": ceremony, "challenge": challenge, "origin": Config.ORIGIN}).encode()
+
+
+class SoftAuthenticator:
+    """Minimal "none"-attestation ES256 authenticator holding a single credential."""
+
+    def __init__(self):
+        self.key = ec.generate_private_key(ec.SECP256R1())
+        self.credential_id = os.urandom(16)
+
+    def create(self, public_key: dict) -> dict:
+        data = client_data(public_key["challenge"])
+        credential_data = (b"\0" * 16 + struct.pack(">H", len(self.credential_id)) + self.credential_id
+                           + cbor.encode(ES256.from_cryptography_key(self.key.public_key())))
+        auth_data = hashlib.sha256(public_key["rp"]["id"].encode()).digest() + b"\x41" + b"\0\0\0\0" + credential_data
+        attestation_object = cbor.encode({"fmt": "none", "attStmt": {}, "authData": auth_data})
+        return {"id": websafe_encode(self.credential_id), "rawId": websafe_encode(self.credential_id),
+                "type": "public-key", "extensions": {},
+                "response": {"clientDataJSON": websafe_encode(data),
+                             "attestationObject": websafe_encode(attestation_object)}}
+
+    def get(self, public_key: dict, counter: int) -> dict:
+        data = client_data(public_key["challenge"], "webauthn.get")
+        auth_data = hashlib.sha256(public_key["rpId"].encode()).digest() + b"\x01" + struct.pack(">I", counter)
+        signature = self.key.sign(auth_data + hashlib.sha256(data).digest(), ec.ECDSA(hashes.SHA256()))
+        return {"id": websafe_encode(self.credential_id), "rawId": websafe_encode(self.credential_id),
+                "type": "public-key",
+                "response": {"clientDataJSON": websafe_encode(data),
+                             "authenticatorData": websafe_encode(auth_data),
+                             "signature": websafe_encode(signature)}}
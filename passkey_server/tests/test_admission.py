@@ -0,0 +1,113 @@
+"""
+Admission control: body limits on the username paths and load shedding ahead of body buffering.
+"""
+import asyncio
+import json
+
+from config import Config
+from middleware.admission import AdmissionControlMiddleware
+
+PATH = "/register/begin"
+
+
+async def _ok_app(scope, receive, send):
+    message = await receive()
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": message["body"]})
+
+
+def _scope(content_length: int | None = None) -> dict:
+    headers = [(b"content-length", str(content_length).encode())] if content_length is not None else []
+    return {"type": "http", "method": "POST", "path": PATH, "headers": headers, "client": ("127.0.0.1", 1)}
+
+
+async def _call(middleware, scope, chunks: list[bytes]) -> tuple[int, bytes, int]:
+    """Runs one request, returning the status, the response body and how many chunks were read."""
+    pending = list(chunks)
+    sent = []
+
+    async def receive():
+        body = pending.pop(0) if pending else b""
+        return {"type": "http.request", "body": body, "more_body": bool(pending)}
+
+    async def send(message):
+        sent.append(message)
+
+    await middleware(scope, receive, send)
+    return sent[0]["status"], sent[1]["body"], len(chunks) - len(pending)
+
+
+def _middleware(app=_ok_app):
+    return AdmissionControlMiddleware(app, username_paths=(PATH,))
+
+
+def test_small_body_is_replayed_downstream():
+    body = json.dumps({"username": "user1@example.com"}).encode()
+    status, echoed, _ = asyncio.run(_call(_middleware(), _scope(len(body)), [body]))
+    assert (status, echoed) == (200, body)
+
+
+def test_declared_oversized_body_is_rejected_unread():
+    status, _, read = asyncio.run(_call(_middleware(), _scope(40 * 2 ** 20), [b"x" * 1024] * 3))
+    assert (status, read) == (413, 0)
+
+
+def test_streamed_oversized_body_is_rejected_while_buffering():
+    chunks = [b"x" * 512] * 10  # no content-length, 5 KB in total
+    status, _, read = asyncio.run(_call(_middleware(), _scope(), chunks))
+    assert status == 413
+    assert read == Config.MAX_USERNAME_BODY_BYTES // 512 + 1
+
+
+def test_load_is_shed_before_the_body_is_read(monkeypatch):
+    monkeypatch.setattr(Config, "MAX_IN_FLIGHT_REQUESTS", 1)
+    monkeypatch.setattr(Config, "MAX_QUEUED_REQUESTS", 0)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def blocking_app(scope, receive, send):
+            await release.wait()
+            await _ok_app(scope, receive, send)
+
+        middleware = _middleware(blocking_app)
+        body = json.dumps({"username": "user1@example.com"}).encode()
+        first = asyncio.create_task(_call(middleware, _scope(len(body)), [body]))
+        await asyncio.sleep(0)
+        shed = await _call(middleware, _scope(len(body)), [body])
+        release.set()
+        return shed, await first
+
+    (status, _, read), (first_status, _, _) = asyncio.run(run())
+    assert (status, read) == (503, 0)
+    assert first_status == 200
+
+
+def test_body_at_the_limit_is_admitted():
+    body = b" " * Config.MAX_USERNAME_BODY_BYTES
+    status, _, _ = asyncio.run(_call(_middleware(), _scope(len(body)), [body]))
+    assert status == 200
+
+
+def test_exempt_paths_bypass_load_shedding(monkeypatch):
+    monkeypatch.setattr(Config, "MAX_IN_FLIGHT_REQUESTS", 1)
+    monkeypatch.setattr(Config, "MAX_QUEUED_REQUESTS", 0)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def blocking_app(scope, receive, send):
+            if scope["path"] == PATH:
+                await release.wait()
+            await _ok_app(scope, receive, send)
+
+        middleware = AdmissionControlMiddleware(blocking_app, exempt_paths=("/debug/profile",))
+        first = asyncio.create_task(_call(middleware, _scope(0), [b""]))
+        await asyncio.sleep(0)
+        profile = await _call(middleware, {**_scope(0), "method": "GET", "path": "/debug/profile"}, [b""])
+        shed = await _call(middleware, _scope(0), [b""])
+        release.set()
+        await first
+        return profile[0], shed[0]
+
+    assert asyncio.run(run()) == (200, 503)
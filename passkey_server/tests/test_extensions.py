@@ -0,0 +1,164 @@
+"""
+Server-to-server extension validation against the real extension server.
+
+The extension app shares top-level module names (config, models, ...) with this service, so it runs
+under uvicorn in a subprocess instead of being imported in-process.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from fido2.utils import websafe_encode, websafe_decode
+
+import main
+from config import Config
+from exceptions import ExtensionValidationError, ExtensionUnavailableError
+from fido.extensions import ExtensionClient
+from fido.store import get_credentials_for_username
+from soft_authenticator import SoftAuthenticator, account_token, client_data
+
+EXTENSION_SERVER_DIR = Path(__file__).resolve().parents[2] / "extension_server"
+USERNAME = "user1@example.com"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def extension_server_url():
+    port = _free_port()
+    env = {**os.environ, "PYTHONPATH": ".", "JWT_SECRET": Config.JWT_SECRET,
+           "RATE_LIMIT_USER_BURST": "1000", "RATE_LIMIT_IP_BURST": "1000"}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "extension_server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=EXTENSION_SERVER_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 15
+    while True:
+        try:
+            httpx.get(f"{url}/metrics/loop-lag")
+            break
+        except httpx.TransportError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                pytest.fail("extension server did not start")
+            time.sleep(0.1)
+    yield url
+    process.terminate()
+    process.wait()
+
+
+async def _with_client(base_url: str, call, transport: httpx.AsyncBaseTransport | None = None):
+    client = ExtensionClient(base_url)
+    client.open(transport)
+    try:
+        return await call(client)
+    finally:
+        await client.aclose()
+
+
+def test_prepare_and_validate_succeed(extension_server_url):
+    token = account_token(USERNAME, "extension-server")
+
+    async def call(client):
+        challenge = await client.prepare(USERNAME, token)
+        await client.validate(USERNAME, token, websafe_encode(client_data(websafe_encode(challenge))))
+        return challenge
+
+    assert len(asyncio.run(_with_client(extension_server_url, call))) == 32
+
+
+def test_rejection_carries_the_extension_server_reason(extension_server_url):
+    token = account_token(USERNAME, "extension-server")
+
+    async def call(client):
+        await client.prepare(USERNAME, token)
+        await client.validate(USERNAME, token, websafe_encode(client_data(websafe_encode(b"\0" * 32))))
+
+    with pytest.raises(ExtensionValidationError, match="Missing or expired challenge"):
+        asyncio.run(_with_client(extension_server_url, call))
+
+
+def test_malformed_payload_is_rejected_without_echoing_it(extension_server_url):
+    oversized = "A" * 6000  # over MAX_CLIENT_DATA_BYTES once decoded, under the admission body limit
+    response = httpx.post(f"{extension_server_url}/extensions/validate",
+                          headers={"Authorization": f"Bearer {account_token(USERNAME, 'extension-server')}"},
+                          json={"username": USERNAME, "credential": {"response": {"clientDataJSON": oversized}}})
+    assert response.status_code == 400
+    body = response.json()
+    assert body["status"] == "invalid" and body["reason"] == "Invalid credential format"
+    assert oversized not in response.text
+
+
+def test_timeout_is_reported_as_unavailable(monkeypatch):
+    monkeypatch.setattr(Config, "EXTENSION_TIMEOUT_SECONDS", 0.05)
+
+    async def slow_app(scope, receive, send):
+        await asyncio.sleep(1)
+
+    async def call(client):
+        await client.prepare(USERNAME, "token")
+
+    with pytest.raises(ExtensionUnavailableError):
+        asyncio.run(_with_client("http://extension", call, httpx.ASGITransport(app=slow_app)))
+
+
+def test_circuit_opens_after_consecutive_failures(monkeypatch):
+    monkeypatch.setattr(Config, "EXTENSION_BREAKER_FAILURES", 3)
+    calls = []
+
+    def refuse(request):
+        calls.append(request)
+        raise httpx.ConnectError("connection refused", request=request)
+
+    async def call(client):
+        for _ in range(3):
+            with pytest.raises(ExtensionUnavailableError):
+                await client.prepare(USERNAME, "token")
+        with pytest.raises(ExtensionUnavailableError) as open_circuit:
+            await client.prepare(USERNAME, "token")
+        return open_circuit.value
+
+    error = asyncio.run(_with_client("http://extension", call, httpx.MockTransport(refuse)))
+    assert len(calls) == 3  # the fourth call was rejected without reaching the transport
+    assert error.retry_after > 0
+
+
+def test_registration_runs_the_extension_check(extension_server_url, monkeypatch):
+    monkeypatch.setattr(main, "extension_client", ExtensionClient(extension_server_url))
+    headers = {"Authorization": f"Bearer {account_token(USERNAME)}",
+               "X-Extension-Token": account_token(USERNAME, "extension-server")}
+
+    with TestClient(main.app) as client:
+        assert client.post("/register/begin", json={"username": USERNAME}).status_code == 401
+
+        begin = client.post("/register/begin", json={"username": USERNAME}, headers=headers).json()
+        assert len(websafe_decode(begin["publicKey"]["challenge"])) == 32  # issued by the extension server
+        authenticator = SoftAuthenticator()
+        response = client.post("/register/complete", headers=headers, json={
+            "attestation": authenticator.create(begin["publicKey"]),
+            "challenge_token": begin["challenge_token"],
+        })
+        assert response.status_code == 200
+
+        # The extension challenge is single-use: a second ceremony reusing it is rejected before storing
+        rejected = client.post("/register/complete", headers=headers, json={
+            "attestation": SoftAuthenticator().create(begin["publicKey"]),
+            "challenge_token": begin["challenge_token"],
+        })
+        assert rejected.status_code == 401
+        assert rejected.json() == {"detail": "Missing or expired challenge"}
+
+    stored = get_credentials_for_username(Config.RP_ID, USERNAME)
+    assert [cred["credential_id"] for cred in stored] == [authenticator.credential_id]
@@ -0,0 +1,43 @@
+"""
+Dropped log records are counted and reported instead of blocking the caller.
+"""
+import logging
+import queue
+
+from fastapi.testclient import TestClient
+
+import main
+from config import Config
+from utils.log import DroppingQueueHandler
+
+
+def _record(event: str) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 0, event, None, None)
+
+
+def test_drops_are_counted_and_reported_with_the_next_record():
+    log_queue = queue.Queue(maxsize=1)
+    handler = DroppingQueueHandler(log_queue)
+
+    for event in ("kept", "dropped", "dropped"):
+        handler.emit(_record(event))
+    assert handler.dropped == 2
+    assert log_queue.get_nowait().getMessage() == "kept"
+
+    handler.emit(_record("dropped"))  # the warning takes the only free slot
+    assert handler.dropped == 3
+    warning = log_queue.get_nowait()
+    assert (warning.getMessage(), warning.levelno, warning.fields) == ("log_records_dropped", logging.WARNING,
+                                                                       {"count": 2})
+
+    handler.emit(_record("kept"))
+    assert log_queue.get_nowait().fields == {"count": 1}
+    assert log_queue.empty()  # "kept" did not fit behind the warning: the queue holds one record
+
+
+def test_memory_metrics_report_dropped_records(monkeypatch):
+    monkeypatch.setattr(Config, "PROFILER_ADMIN_TOKEN", "admin")
+    with TestClient(main.app) as client:
+        response = client.get("/metrics/memory", headers={"X-Admin-Token": "admin"})
+    assert response.status_code == 200
+    assert response.json()["dropped_log_records"] >= 0
@@ -0,0 +1,155 @@
+"""
+Attestation verification against MDS metadata: AAGUID lookup, compromised keys, the chain validation cache
+and the policy for attestation without a certificate chain.
+
+The verifier is fed a snapshot built in memory rather than a signed blob.
+"""
+import datetime
+import hashlib
+import os
+import struct
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from fido2 import cbor
+from fido2.attestation import UntrustedAttestation
+from fido2.cose import ES256
+from fido2.webauthn import Aaguid, AttestationObject
+
+from config import Config
+from fido.metadata import MetadataAttestationVerifier, MetadataEntry, MetadataSnapshot, TrustAnchor
+
+LISTED = Aaguid(os.urandom(16))
+CLIENT_DATA_HASH = hashlib.sha256(b"client data").digest()
+
+
+def _name(common_name: str, unit: str = "Authenticator Attestation") -> x509.Name:
+    return x509.Name([
+        x509.NameAttribute(NameOID.COUNTRY_NAME, "SE"),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "Test Vendor"),
+        x509.NameAttribute(NameOID.ORGANIZATIONAL_UNIT_NAME, unit),
+        x509.NameAttribute(NameOID.COMMON_NAME, common_name),
+    ])
+
+
+def _certificate(subject: x509.Name, issuer: x509.Name, public_key, signing_key, ca: bool) -> bytes:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (x509.CertificateBuilder()
+                   .subject_name(subject).issuer_name(issuer).public_key(public_key)
+                   .serial_number(x509.random_serial_number())
+                   .not_valid_before(now - datetime.timedelta(days=1))
+                   .not_valid_after(now + datetime.timedelta(days=365))
+                   .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+                   .sign(signing_key, hashes.SHA256()))
+    return certificate.public_bytes(serialization.Encoding.DER)
+
+
+class Vendor:
+    """A root CA and one batch attestation certificate issued by it."""
+
+    def __init__(self):
+        self.root_key = ec.generate_private_key(ec.SECP256R1())
+        root_name = _name("Test Root CA", "Root")
+        self.root = TrustAnchor(subject=root_name, der=_certificate(
+            root_name, root_name, self.root_key.public_key(), self.root_key, ca=True))
+        self.attestation_key = ec.generate_private_key(ec.SECP256R1())
+        self.attestation_certificate = _certificate(
+            _name("Test Batch"), root_name, self.attestation_key.public_key(), self.root_key, ca=False)
+
+    def attest(self, aaguid: Aaguid, fmt: str = "packed") -> AttestationObject:
+        credential_key = ec.generate_private_key(ec.SECP256R1())
+        credential_id = os.urandom(16)
+        auth_data = (hashlib.sha256(b"localhost").digest() + b"\x41" + b"\0\0\0\0" + aaguid
+                     + struct.pack(">H", len(credential_id)) + credential_id
+                     + cbor.encode(ES256.from_cryptography_key(credential_key.public_key())))
+        if fmt == "none":
+            statement = {}
+        else:
+            signature = self.attestation_key.sign(auth_data + CLIENT_DATA_HASH, ec.ECDSA(hashes.SHA256()))
+            statement = {"alg": -7, "sig": signature, "x5c": [self.attestation_certificate]}
+        return AttestationObject(cbor.encode({"fmt": fmt, "attStmt": statement, "authData": auth_data}))
+
+
+@pytest.fixture
+def vendor():
+    return Vendor()
+
+
+def _verifier(monkeypatch, entries: dict) -> MetadataAttestationVerifier:
+    monkeypatch.setattr(MetadataAttestationVerifier, "load", lambda self: None)
+    verifier = MetadataAttestationVerifier("unused.jwt")
+    verifier._snapshot = MetadataSnapshot(entries, None)
+    return verifier
+
+
+def _entry(vendor: Vendor, compromised: frozenset[bytes] = frozenset()) -> MetadataEntry:
+    return MetadataEntry(description="Test key", roots=[vendor.root], compromised_certificates=compromised)
+
+
+def test_listed_authenticator_with_a_valid_chain_is_trusted(monkeypatch, vendor):
+    verifier = _verifier(monkeypatch, {LISTED: _entry(vendor)})
+    verifier.verify_attestation(vendor.attest(LISTED), CLIENT_DATA_HASH)
+
+
+def test_unlisted_authenticator_is_rejected(monkeypatch, vendor):
+    verifier = _verifier(monkeypatch, {LISTED: _entry(vendor)})
+    with pytest.raises(UntrustedAttestation, match="not found in metadata"):
+        verifier.verify_attestation(vendor.attest(Aaguid(os.urandom(16))), CLIENT_DATA_HASH)
+
+
+def test_chain_to_another_root_is_rejected(monkeypatch, vendor):
+    verifier = _verifier(monkeypatch, {LISTED: _entry(Vendor())})  # same subject, different key
+    with pytest.raises(UntrustedAttestation, match="trusted root"):
+        verifier.verify_attestation(vendor.attest(LISTED), CLIENT_DATA_HASH)
+
+
+def test_compromised_attestation_key_is_rejected(monkeypatch, vendor):
+    verifier = _verifier(monkeypatch, {LISTED: _entry(vendor, frozenset([vendor.attestation_certificate]))})
+    with pytest.raises(UntrustedAttestation, match="compromised"):
+        verifier.verify_attestation(vendor.attest(LISTED), CLIENT_DATA_HASH)
+
+
+def test_chain_validation_is_cached_per_certificate(monkeypatch, vendor):
+    verifier = _verifier(monkeypatch, {LISTED: _entry(vendor)})
+    calls = []
+    validate_chain = MetadataAttestationVerifier._validate_chain
+    monkeypatch.setattr(MetadataAttestationVerifier, "_validate_chain",
+                        staticmethod(lambda entry, trust_path: calls.append(1) or validate_chain(entry, trust_path)))
+
+    for _ in range(3):
+        verifier.verify_attestation(vendor.attest(LISTED), CLIENT_DATA_HASH)
+    assert len(calls) == 1
+    cache_key = (LISTED, hashlib.sha256(vendor.attestation_certificate).digest())
+    assert verifier._snapshot.chain_cache == {cache_key: True}
+
+
+def test_chain_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(Config, "ATTESTATION_CACHE_SIZE", 2)
+    vendors = [Vendor() for _ in range(3)]
+    verifier = _verifier(monkeypatch, {LISTED: MetadataEntry("Test key", [v.root for v in vendors], frozenset())})
+
+    for vendor in vendors:
+        verifier.verify_attestation(vendor.attest(LISTED), CLIENT_DATA_HASH)
+    assert [key[1] for key in verifier._snapshot.chain_cache] == [
+        hashlib.sha256(vendor.attestation_certificate).digest() for vendor in vendors[1:]
+    ]
+
+
+@pytest.mark.parametrize("policy, listed_ok, unlisted_ok", [
+    ("reject", False, False),
+    ("unlisted", False, True),
+    ("allow", True, True),
+])
+def test_unattested_policy(monkeypatch, vendor, policy, listed_ok, unlisted_ok):
+    monkeypatch.setattr(Config, "MDS_UNATTESTED_POLICY", policy)
+    verifier = _verifier(monkeypatch, {LISTED: _entry(vendor)})
+
+    for aaguid, accepted in ((LISTED, listed_ok), (Aaguid(os.urandom(16)), unlisted_ok)):
+        if accepted:
+            verifier.verify_attestation(vendor.attest(aaguid, "none"), CLIENT_DATA_HASH)
+        else:
+            with pytest.raises(UntrustedAttestation, match="no certificate chain"):
+                verifier.verify_attestation(vendor.attest(aaguid, "none"), CLIENT_DATA_HASH)
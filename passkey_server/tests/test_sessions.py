@@ -0,0 +1,106 @@
+"""
+Session resumption: issue on /authenticate/complete, verify on /session/verify, and the revocation paths.
+"""
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from config import Config
+from fido.sessions import SESSION_CACHE, verify_session
+from fido.store import remove_credential
+from soft_authenticator import SoftAuthenticator, account_token
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def username():
+    return f"session-{os.urandom(4).hex()}@example.com"
+
+
+def _register(client, username: str) -> SoftAuthenticator:
+    authenticator = SoftAuthenticator()
+    begin = client.post("/register/begin", json={"username": username}).json()
+    response = client.post("/register/complete", headers={"Authorization": f"Bearer {account_token(username)}"},
+                           json={"attestation": authenticator.create(begin["publicKey"]),
+                                 "challenge_token": begin["challenge_token"]})
+    assert response.status_code == 200
+    return authenticator
+
+
+def _authenticate(client, username: str, authenticator: SoftAuthenticator, counter: int,
+                  audience: str | None = "app"):
+    begin = client.post("/authenticate/begin", json={"username": username}).json()
+    return client.post("/authenticate/complete", headers={"Authorization": f"Bearer {account_token(username)}"},
+                       json={"assertion": authenticator.get(begin["publicKey"], counter),
+                             "challenge_token": begin["challenge_token"],
+                             "session_audience": audience})
+
+
+def _verify(client, token: str, audience: str = "app"):
+    return client.post("/session/verify", json={"session_token": token, "audience": audience})
+
+
+def test_session_is_issued_and_verified(client, username):
+    authenticator = _register(client, username)
+    complete = _authenticate(client, username, authenticator, counter=1).json()
+    assert complete["session_expires_in"] == Config.SESSION_TTL_SECONDS
+
+    response = _verify(client, complete["session_token"])
+    assert response.status_code == 200
+    assert response.json()[Config.USER_KEY] == username
+
+
+def test_unknown_audience_is_rejected_at_issue(client, username):
+    authenticator = _register(client, username)
+    response = _authenticate(client, username, authenticator, counter=1, audience="elsewhere")
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Unknown session audience"}
+
+
+def test_session_is_bound_to_its_audience(client, username):
+    authenticator = _register(client, username)
+    token = _authenticate(client, username, authenticator, counter=1).json()["session_token"]
+
+    assert _verify(client, token, audience="admin").status_code == 401
+    assert _verify(client, token).status_code == 200  # a wrong-audience attempt does not revoke it
+
+
+def test_session_is_bound_to_its_relying_party(client, username):
+    authenticator = _register(client, username)
+    token = _authenticate(client, username, authenticator, counter=1).json()["session_token"]
+
+    with pytest.raises(ValueError, match="Invalid or expired session"):
+        verify_session(token, "app", "other.example.com")
+    assert verify_session(token, "app", Config.RP_ID).username == username
+
+
+def test_counter_regression_revokes_live_sessions(client, username):
+    authenticator = _register(client, username)
+    first = _authenticate(client, username, authenticator, counter=1).json()["session_token"]
+    second = _authenticate(client, username, authenticator, counter=2).json()["session_token"]
+
+    regressed = _authenticate(client, username, authenticator, counter=2)
+    assert regressed.status_code == 400
+    assert regressed.json() == {"detail": "Signature counter regression"}
+
+    for token in (first, second):
+        assert token not in SESSION_CACHE
+        assert _verify(client, token).status_code == 401
+
+
+def test_removed_credential_invalidates_its_sessions(client, username):
+    authenticator = _register(client, username)
+    token = _authenticate(client, username, authenticator, counter=1).json()["session_token"]
+
+    assert remove_credential(Config.RP_ID, authenticator.credential_id)
+    response = _verify(client, token)
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Invalid or expired session"}
+    assert token not in SESSION_CACHE  # dropped on first use rather than left to expire
@@ -0,0 +1,73 @@
+import os
+import resource
+import threading
+import tracemalloc
+from typing import Any, Dict
+
+from config import Config
+
+# Allocations made by tracemalloc itself or the import machinery are noise in a leak hunt
+_TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+
+
+def current_rss() -> int:
+    """Resident set size in bytes (Linux /proc), falling back to the peak RSS elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryTracker:
+    """
+    Reports process memory next to the size of the service's in-memory structures, with growth since the
+    previous report, so a soak run can tell growth backed by live state from a leak.
+
+    When TRACEMALLOC_FRAMES is set, tracing starts at import and reports also list the top allocation sites
+    and the sites that changed the most since the previous report.
+    """
+
+    def __init__(self):
+        if Config.TRACEMALLOC_FRAMES and not tracemalloc.is_tracing():
+            tracemalloc.start(Config.TRACEMALLOC_FRAMES)
+        self._previous_structures: Dict[str, int] = {}
+        self._previous_snapshot: tracemalloc.Snapshot | None = None
+        self._lock = threading.Lock()
+
+    def report(self, structures: Dict[str, int]) -> Dict[str, Any]:
+        with self._lock:
+            result = {
+                "rss_bytes": current_rss(),
+                "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                "structures": structures,
+                "structures_growth": {
+                    name: size - self._previous_structures.get(name, 0) for name, size in structures.items()
+                },
+            }
+            self._previous_structures = dict(structures)
+
+            if tracemalloc.is_tracing():
+                limit = Config.MEMORY_TOP_ALLOCATIONS
+                snapshot = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+                traced, peak = tracemalloc.get_traced_memory()
+                result["traced_bytes"] = traced
+                result["traced_peak_bytes"] = peak
+                result["top_allocations"] = [
+                    {"site": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:limit]
+                ]
+                if self._previous_snapshot is not None:
+                    result["top_growth"] = [
+                        {"site": str(stat.traceback), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+                        for stat in snapshot.compare_to(self._previous_snapshot, "lineno")[:limit]
+                    ]
+                self._previous_snapshot = snapshot
+            return result
+
+
+memory_tracker = MemoryTracker()
@@ -0,0 +1,46 @@
+from dataclasses import fields
+from functools import lru_cache
+from typing import Any
+
+from fido2.utils import websafe_encode
+
+
+@lru_cache(maxsize=None)
+def _field_plan(cls: type) -> tuple[tuple[str, str, Any], ...]:
+    """
+    (attribute, JSON key, serializer) per field, computed once per options class.
+    Keys follow fido2's JSON naming rule: explicit `name` metadata, else camelCase.
+    """
+    plan = []
+    for field in fields(cls):
+        key = field.metadata.get("name")
+        if not key:
+            parts = field.name.split("_")
+            key = parts[0] + "".join(p.title() for p in parts[1:])
+        plan.append((field.name, key, field.metadata.get("serialize")))
+    return tuple(plan)
+
+
+def _to_json_value(value: Any) -> Any:
+    if hasattr(type(value), "__dataclass_fields__"):
+        return options_to_json(value)
+    if isinstance(value, bytes):
+        return websafe_encode(value)
+    if isinstance(value, (list, tuple)):
+        return [_to_json_value(v) for v in value]
+    return value
+
+
+def options_to_json(options: Any) -> dict:
+    """
+    Converts a fido2 options object (e.g. PublicKeyCredentialCreationOptions) into a JSON-ready dict
+    in a single pass over its dataclass fields, producing the same output as `dict(options)`
+    without fido2's per-item Mapping checks and intermediate copies.
+    """
+    result = {}
+    for attr, key, serialize in _field_plan(type(options)):
+        value = getattr(options, attr)
+        if value is None:
+            continue
+        result[key] = _to_json_value(serialize(value) if serialize else value)
+    return result
@@ -0,0 +1,504 @@
+"""
+Soak driver: mixed traffic through the IdP, extension and passkey servers while sampling their memory.
+
+Starts the three services under uvicorn (or targets running ones with --no-spawn) and, for --duration
+seconds, starts --rate scenarios per second drawn from a weighted mix:
+  - IdP token generation, including wrong passwords
+  - passkey registration and authentication with session resumption and /session/verify
+  - abandoned ceremonies (begin without complete), failed completes (bad signature, mismatched
+    challenge, counter regression) and malformed payloads
+  - extension prepare/validate, abandoned prepares and challenge mismatches
+
+Every --sample-interval seconds, /metrics/memory is polled on each service with X-Admin-Token. After
+--warmup seconds, memory growth is compared with the growth of the live state each service reports
+(credentials, sessions, challenges, ...): the run fails when RSS or traced memory grew by more than
+--bytes-per-item per added item plus --slack-mb, or when any request ended in a 500.
+
+Run with an interpreter that has the dependencies of all three services, e.g. from passkey_server/:
+    uv run python ../soak/run_soak.py --duration 3600 --rate 50 --report soak.json
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+import httpx
+import jwt
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from fido2 import cbor
+from fido2.cose import ES256
+from fido2.utils import websafe_encode, websafe_decode
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Service name -> (directory, uvicorn app, default port)
+SERVICES = {
+    "idp": ("idp_server", "idp:app", 18001),
+    "extension": ("extension_server", "extension_server:app", 19000),
+    "passkey": ("passkey_server", "main:app", 18000),
+}
+
+# Defaults for spawned services; anything already set in the environment wins
+SERVICE_ENV = {
+    "RATE_LIMIT_IP_PER_SECOND": "1000000",
+    "RATE_LIMIT_IP_BURST": "1000000",
+    "RATE_LIMIT_USER_PER_SECOND": "1000000",
+    "RATE_LIMIT_USER_BURST": "1000000",
+    "LOG_LEVEL": "WARNING",
+    "LOG_SUCCESS_SAMPLE_RATE": "0",
+    "SESSION_AUDIENCES": "soak",
+}
+
+# IdP stub user (idp_server/database/users_stub.py)
+IDP_USER, IDP_PASSWORD, IDP_ACCOUNT = "user1@example.com", "UserOne", "acc001"
+
+JWT_SECRET = os.getenv("JWT_SECRET", "super-secure-token")
+ORIGIN = os.getenv("ORIGIN", "http://localhost:8000")
+
+# Scenario -> weight
+MIX = {
+    "idp_token": 10,
+    "idp_bad_password": 3,
+    "register": 10,
+    "register_abandoned": 5,
+    "register_bad_challenge": 3,
+    "register_malformed": 2,
+    "authenticate": 15,
+    "authenticate_abandoned": 5,
+    "authenticate_bad_signature": 3,
+    "authenticate_counter_regression": 2,
+    "extension": 10,
+    "extension_abandoned": 5,
+    "extension_mismatch": 3,
+}
+
+# Status codes a scenario is allowed to end with; anything else is counted as unexpected
+ACCEPTED = {
+    "idp_token": {200},
+    "idp_bad_password": {401},
+    "register": {200, 400},  # 400 once the user reached MAX_CREDENTIALS_PER_USER
+    "register_abandoned": {200, 400},
+    "register_bad_challenge": {400},
+    "register_malformed": {400},
+    "authenticate": {200},
+    "authenticate_abandoned": {200},
+    "authenticate_bad_signature": {400},
+    "authenticate_counter_regression": {400},
+    "extension": {200},
+    "extension_abandoned": {200},
+    "extension_mismatch": {401},
+}
+
+
+def mint_token(user: str, audience: str) -> str:
+    now = int(time.time())
+    return jwt.encode({"user": user, "account_id": IDP_ACCOUNT, "iss": "identity-provider", "aud": audience,
+                       "iat": now, "exp": now + 60}, JWT_SECRET, algorithm="HS256")
+
+
+def client_data(challenge: str, ceremony: str) -> bytes:
+    return json.dumps({"type": ceremony, "challenge": challenge, "origin": ORIGIN}).encode()
+
+
+class Authenticator:
+    """Software ES256 authenticator ("none" attestation) holding a single credential."""
+
+    def __init__(self, username: str):
+        self.username = username
+        self.key = ec.generate_private_key(ec.SECP256R1())
+        self.credential_id = os.urandom(16)
+        self.counter = 0
+        self.busy = False
+
+    def create(self, public_key: dict, challenge: str | None = None) -> dict:
+        data = client_data(challenge or public_key["challenge"], "webauthn.create")
+        credential_data = (b"\0" * 16 + struct.pack(">H", len(self.credential_id)) + self.credential_id
+                           + cbor.encode(ES256.from_cryptography_key(self.key.public_key())))
+        auth_data = hashlib.sha256(public_key["rp"]["id"].encode()).digest() + b"\x41" + b"\0\0\0\0" + credential_data
+        attestation_object = cbor.encode({"fmt": "none", "attStmt": {}, "authData": auth_data})
+        return {"id": websafe_encode(self.credential_id), "rawId": websafe_encode(self.credential_id),
+                "type": "public-key", "extensions": {},
+                "response": {"clientDataJSON": websafe_encode(data),
+                             "attestationObject": websafe_encode(attestation_object)}}
+
+    def get(self, public_key: dict, counter: int, corrupt: bool = False) -> dict:
+        data = client_data(public_key["challenge"], "webauthn.get")
+        auth_data = hashlib.sha256(public_key["rpId"].encode()).digest() + b"\x01" + struct.pack(">I", counter)
+        signature = self.key.sign(auth_data + hashlib.sha256(data).digest(), ec.ECDSA(hashes.SHA256()))
+        if corrupt:
+            auth_data = auth_data[:-1] + bytes([auth_data[-1] ^ 1])
+        return {"id": websafe_encode(self.credential_id), "rawId": websafe_encode(self.credential_id),
+                "type": "public-key",
+                "response": {"clientDataJSON": websafe_encode(data),
+                             "authenticatorData": websafe_encode(auth_data),
+                             "signature": websafe_encode(signature)}}
+
+
+class NoIdleCredential(Exception):
+    pass
+
+
+class UnexpectedStatus(Exception):
+    def __init__(self, response: httpx.Response):
+        super().__init__(response.status_code)
+        self.status_code = response.status_code
+
+
+@dataclass
+class Sample:
+    elapsed: float
+    service: str
+    rss_bytes: int
+    traced_bytes: int | None
+    structures: dict
+
+
+class Soak:
+    def __init__(self, args, urls: dict[str, str]):
+        self.args = args
+        self.urls = urls
+        self.client = httpx.AsyncClient(timeout=10, limits=httpx.Limits(max_connections=args.concurrency * 2))
+        self.users = [f"soak-{i}@example.com" for i in range(args.users)]
+        self.authenticators: list[Authenticator] = []
+        self.outcomes: dict[str, Counter] = defaultdict(Counter)
+        self.samples: list[Sample] = []
+        self.growth_sites: dict[str, Counter] = defaultdict(Counter)
+        self.started = time.monotonic()
+        self.skipped = 0
+
+    async def post(self, service: str, path: str, body: dict, token: str | None = None) -> httpx.Response:
+        headers = {"Authorization": f"Bearer {token}"} if token else None
+        return await self.client.post(f"{self.urls[service]}{path}", json=body, headers=headers)
+
+    async def ok(self, response: httpx.Response) -> dict:
+        if response.status_code != 200:
+            raise UnexpectedStatus(response)
+        return response.json()
+
+    # ---- Scenarios; each returns the status code it ended with ----
+    async def idp_token(self) -> int:
+        response = await self.post("idp", "/token/generate",
+                                   {"username": IDP_USER, "password": IDP_PASSWORD, "account_id": IDP_ACCOUNT})
+        return response.status_code
+
+    async def idp_bad_password(self) -> int:
+        response = await self.post("idp", "/token/generate",
+                                   {"username": IDP_USER, "password": "wrong", "account_id": IDP_ACCOUNT})
+        return response.status_code
+
+    async def register_begin(self, username: str) -> dict:
+        return await self.ok(await self.post("passkey", "/register/begin", {"username": username}))
+
+    async def register(self) -> int:
+        authenticator = Authenticator(random.choice(self.users))
+        begin = await self.register_begin(authenticator.username)
+        response = await self.post("passkey", "/register/complete", {
+            "attestation": authenticator.create(begin["publicKey"]),
+            "challenge_token": begin["challenge_token"],
+        }, mint_token(authenticator.username, "relying-party-server"))
+        if response.status_code == 200:
+            self.authenticators.append(authenticator)
+        return response.status_code
+
+    async def register_abandoned(self) -> int:
+        await self.register_begin(random.choice(self.users))
+        return 200
+
+    async def register_bad_challenge(self) -> int:
+        authenticator = Authenticator(random.choice(self.users))
+        begin = await self.register_begin(authenticator.username)
+        response = await self.post("passkey", "/register/complete", {
+            "attestation": authenticator.create(begin["publicKey"], websafe_encode(os.urandom(32))),
+            "challenge_token": begin["challenge_token"],
+        }, mint_token(authenticator.username, "relying-party-server"))
+        return response.status_code
+
+    async def register_malformed(self) -> int:
+        username = random.choice(self.users)
+        begin = await self.register_begin(username)
+        attestation = Authenticator(username).create(begin["publicKey"])
+        raw = websafe_decode(attestation["response"]["attestationObject"])
+        attestation["response"]["attestationObject"] = websafe_encode(raw[:random.randrange(1, len(raw))])
+        response = await self.post("passkey", "/register/complete", {
+            "attestation": attestation, "challenge_token": begin["challenge_token"],
+        }, mint_token(username, "relying-party-server"))
+        return response.status_code
+
+    async def with_credential(self, ceremony) -> int:
+        idle = [authenticator for authenticator in self.authenticators if not authenticator.busy]
+        if not idle:
+            raise NoIdleCredential()
+        authenticator = random.choice(idle)
+        authenticator.busy = True  # concurrent ceremonies on one credential would race its counter
+        try:
+            begin = await self.ok(await self.post("passkey", "/authenticate/begin",
+                                                  {"username": authenticator.username}))
+            return await ceremony(authenticator, begin)
+        finally:
+            authenticator.busy = False
+
+    async def authenticate_complete(self, authenticator: Authenticator, begin: dict, counter: int,
+                                    corrupt: bool = False) -> httpx.Response:
+        return await self.post("passkey", "/authenticate/complete", {
+            "assertion": authenticator.get(begin["publicKey"], counter, corrupt),
+            "challenge_token": begin["challenge_token"],
+            "session_audience": "soak",
+        }, mint_token(authenticator.username, "relying-party-server"))
+
+    async def authenticate(self) -> int:
+        async def ceremony(authenticator, begin):
+            authenticator.counter += 1
+            complete = await self.ok(await self.authenticate_complete(authenticator, begin, authenticator.counter))
+            response = await self.post("passkey", "/session/verify",
+                                       {"session_token": complete["session_token"], "audience": "soak"})
+            return response.status_code
+
+        return await self.with_credential(ceremony)
+
+    async def authenticate_abandoned(self) -> int:
+        async def ceremony(authenticator, begin):
+            return 200
+
+        return await self.with_credential(ceremony)
+
+    async def authenticate_bad_signature(self) -> int:
+        async def ceremony(authenticator, begin):
+            response = await self.authenticate_complete(authenticator, begin, authenticator.counter + 1, True)
+            return response.status_code
+
+        return await self.with_credential(ceremony)
+
+    async def authenticate_counter_regression(self) -> int:
+        async def ceremony(authenticator, begin):
+            if not authenticator.counter:
+                return 400  # nothing to regress from yet
+            response = await self.authenticate_complete(authenticator, begin, authenticator.counter)
+            return response.status_code
+
+        return await self.with_credential(ceremony)
+
+    async def extension_prepare(self, username: str, token: str) -> str:
+        return (await self.ok(await self.post("extension", "/extensions/prepare", {"username": username},
+                                              token)))["challenge"]
+
+    async def extension_validate(self, username: str, token: str, challenge: str) -> int:
+        response = await self.post("extension", "/extensions/validate", {
+            "username": username,
+            "credential": {"response": {"clientDataJSON": websafe_encode(client_data(challenge, "webauthn.get"))}},
+        }, token)
+        return response.status_code
+
+    async def extension(self) -> int:
+        username = random.choice(self.users)
+        token = mint_token(username, "extension-server")
+        return await self.extension_validate(username, token, await self.extension_prepare(username, token))
+
+    async def extension_abandoned(self) -> int:
+        # A fresh username each time: only the sweep can reclaim these challenges
+        username = f"abandoned-{os.urandom(8).hex()}@example.com"
+        await self.extension_prepare(username, mint_token(username, "extension-server"))
+        return 200
+
+    async def extension_mismatch(self) -> int:
+        username = random.choice(self.users)
+        token = mint_token(username, "extension-server")
+        await self.extension_prepare(username, token)
+        return await self.extension_validate(username, token, websafe_encode(os.urandom(32)))
+
+    async def run_scenario(self, name: str):
+        try:
+            status = await getattr(self, name)()
+        except UnexpectedStatus as e:
+            status = e.status_code
+        except NoIdleCredential:
+            self.outcomes[name]["no_idle_credential"] += 1
+            return
+        except httpx.HTTPError as e:
+            self.outcomes[name][type(e).__name__] += 1
+            return
+        self.outcomes[name]["ok" if status in ACCEPTED[name] else status] += 1
+
+    # ---- Memory sampling ----
+    async def sample(self):
+        elapsed = time.monotonic() - self.started
+        line = [f"[{elapsed:7.0f}s]"]
+        for service, url in self.urls.items():
+            response = await self.client.get(f"{url}/metrics/memory", headers={"X-Admin-Token": self.args.admin_token},
+                                             timeout=120)
+            report = await self.ok(response)
+            self.samples.append(Sample(elapsed, service, report["rss_bytes"], report.get("traced_bytes"),
+                                       report["structures"]))
+            if elapsed >= self.args.warmup:
+                for site in report.get("top_growth", []):
+                    self.growth_sites[service][site["site"]] += site["size_diff_bytes"]
+            line.append(f"{service} rss={report['rss_bytes'] / 2 ** 20:.1f}MB "
+                        + " ".join(f"{name}={size}" for name, size in report["structures"].items()))
+        print(" | ".join(line), flush=True)
+
+    async def sampler(self, stop: asyncio.Event):
+        while not stop.is_set():
+            await self.sample()
+            try:
+                await asyncio.wait_for(stop.wait(), self.args.sample_interval)
+            except asyncio.TimeoutError:
+                pass
+        await self.sample()
+
+    async def drive(self):
+        names, weights = list(MIX), list(MIX.values())
+        tasks: set[asyncio.Task] = set()
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(self.sampler(stop))
+        deadline = self.started + self.args.duration
+        next_at = time.monotonic()
+        while time.monotonic() < deadline:
+            if len(tasks) < self.args.concurrency:
+                task = asyncio.create_task(self.run_scenario(random.choices(names, weights)[0]))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            else:
+                self.skipped += 1  # the services (or this driver) cannot keep up with --rate
+            next_at += 1 / self.args.rate
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+        await asyncio.gather(*tasks)
+        stop.set()
+        await sampler
+        await self.client.aclose()
+
+    # ---- Verdict ----
+    def verdict(self) -> bool:
+        passed = True
+        budget = self.args.bytes_per_item
+        slack = self.args.slack_mb * 2 ** 20
+        print("\nScenario outcomes:")
+        for name in MIX:
+            outcomes = self.outcomes.get(name, Counter())
+            print(f"  {name:34} " + ", ".join(f"{outcome}={count}" for outcome, count in outcomes.most_common()))
+            if outcomes.get(500):
+                passed = False
+        if self.skipped:
+            print(f"  (skipped {self.skipped} scenarios: --concurrency {self.args.concurrency} saturated)")
+
+        print(f"\nMemory after {self.args.warmup}s warm-up (budget {budget} B/item, slack {self.args.slack_mb} MB):")
+        for service in self.urls:
+            samples = [s for s in self.samples if s.service == service and s.elapsed >= self.args.warmup]
+            if len(samples) < 2:
+                print(f"  {service}: not enough samples after warm-up")
+                passed = False
+                continue
+            first, last = samples[0], samples[-1]
+            added = {name: last.structures.get(name, 0) - size for name, size in first.structures.items()}
+            justified = budget * sum(max(0, delta) for delta in added.values())
+            hours = max(last.elapsed - first.elapsed, 1) / 3600
+            print(f"  {service}: " + ", ".join(f"{name} {first.structures[name]}->{last.structures.get(name, 0)}"
+                                               for name in first.structures))
+            metrics = [("rss", first.rss_bytes, last.rss_bytes)]
+            if first.traced_bytes is not None and last.traced_bytes is not None:
+                metrics.append(("traced", first.traced_bytes, last.traced_bytes))
+            for metric, start, end in metrics:
+                unexplained = end - start - justified
+                ok = unexplained <= slack
+                passed &= ok
+                print(f"    {metric:6} {start / 2 ** 20:8.1f}MB -> {end / 2 ** 20:8.1f}MB, "
+                      f"unexplained {unexplained / 2 ** 20:+.1f}MB ({unexplained / 2 ** 20 / hours:+.1f}MB/h) "
+                      f"{'ok' if ok else 'FAIL'}")
+            for site, size in self.growth_sites[service].most_common(self.args.top_sites):
+                if size > 0:
+                    print(f"    +{size / 1024:9.1f}KB {site}")
+        print("\nPASS" if passed else "\nFAIL")
+        return passed
+
+    def write_report(self, path: str):
+        with open(path, "w") as f:
+            json.dump({
+                "args": vars(self.args),
+                "outcomes": {name: dict(outcomes) for name, outcomes in self.outcomes.items()},
+                "skipped": self.skipped,
+                "samples": [vars(sample) for sample in self.samples],
+                "growth_sites": {service: dict(sites.most_common(self.args.top_sites))
+                                 for service, sites in self.growth_sites.items()},
+            }, f, indent=2, default=str)
+
+
+def spawn(args, log_dir: Path) -> list[subprocess.Popen]:
+    processes = []
+    for service, (directory, app, _) in SERVICES.items():
+        env = {**SERVICE_ENV, **os.environ, "PYTHONPATH": ".", "PROFILER_ADMIN_TOKEN": args.admin_token,
+               "TRACEMALLOC_FRAMES": str(args.tracemalloc_frames)}
+        log = open(log_dir / f"{service}.log", "w")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", app, "--port", str(getattr(args, f"{service}_port")),
+             "--log-level", "warning"],
+            cwd=ROOT / directory, env=env, stdout=log, stderr=subprocess.STDOUT,
+        ))
+    return processes
+
+
+def wait_ready(urls: dict[str, str], admin_token: str, processes: list[subprocess.Popen]):
+    deadline = time.monotonic() + 30
+    for service, url in urls.items():
+        while True:
+            try:
+                response = httpx.get(f"{url}/metrics/memory", headers={"X-Admin-Token": admin_token})
+                response.raise_for_status()
+                break
+            except httpx.HTTPError:
+                if any(p.poll() is not None for p in processes) or time.monotonic() > deadline:
+                    raise SystemExit(f"{service} did not become ready at {url}")
+                time.sleep(0.2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=600, help="seconds of traffic")
+    parser.add_argument("--rate", type=float, default=50, help="scenarios started per second")
+    parser.add_argument("--concurrency", type=int, default=64, help="maximum scenarios in flight")
+    parser.add_argument("--users", type=int, default=500, help="passkey usernames to spread registrations over")
+    parser.add_argument("--sample-interval", type=float, default=15)
+    parser.add_argument("--warmup", type=float, default=60, help="seconds excluded from the growth check")
+    parser.add_argument("--bytes-per-item", type=int, default=4096,
+                        help="memory each added live-state item (credential, session, challenge, ...) may use")
+    parser.add_argument("--slack-mb", type=float, default=16, help="growth allowed beyond the live-state budget")
+    parser.add_argument("--top-sites", type=int, default=5, help="fastest-growing allocation sites to report")
+    parser.add_argument("--tracemalloc-frames", type=int, default=1, help="TRACEMALLOC_FRAMES for spawned services")
+    parser.add_argument("--admin-token", default=base64.urlsafe_b64encode(os.urandom(18)).decode())
+    parser.add_argument("--no-spawn", action="store_true",
+                        help="target already running services (their PROFILER_ADMIN_TOKEN must match --admin-token)")
+    parser.add_argument("--report", help="write outcomes and all samples as JSON to this path")
+    for service, (_, _, port) in SERVICES.items():
+        parser.add_argument(f"--{service}-port", type=int, default=port)
+    args = parser.parse_args()
+
+    urls = {service: f"http://127.0.0.1:{getattr(args, f'{service}_port')}" for service in SERVICES}
+    processes = []
+    if not args.no_spawn:
+        log_dir = Path(tempfile.mkdtemp(prefix="soak-"))
+        print(f"Service logs: {log_dir}")
+        processes = spawn(args, log_dir)
+    try:
+        wait_ready(urls, args.admin_token, processes)
+        soak = Soak(args, urls)
+        asyncio.run(soak.drive())
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+    if args.report:
+        soak.write_report(args.report)
+    sys.exit(0 if soak.verdict() else 1)
+
+
+if __name__ == "__main__":
+    main()